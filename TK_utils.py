@@ -8,7 +8,6 @@ from datetime import datetime, timedelta
 from random import shuffle
 from traceback import print_exc
 
-import matplotlib.path as mpltPath
 import pandas as pd
 import requests
 
@@ -111,7 +110,7 @@ def set_date():
         if match is not None:
             break
         if not load_date:  # default value - yesterday
-            load_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+            load_date = yesterday()
             print(load_date)
             return load_date
         print("Date format's wrong, lol!")
@@ -128,7 +127,16 @@ def set_interval():
     start_date = set_date()
     print('End date!', end=' ')
     end_date = set_date()
-    # Create date range
+    return date_range(start_date, end_date)
+
+
+def date_range(start_date, end_date):
+    """
+    Creates list of dates between start and end dates (included)
+    :param start_date: first date in 'YYYY-MM-DD' format
+    :param end_date: last date in 'YYYY-MM-DD' format
+    :return: list of dates in 'YYYY-MM-DD' format
+    """
     dates = pd.date_range(start_date, end_date, freq='D').tolist()
     date_list = []
     for date_i in dates:
@@ -136,6 +144,13 @@ def set_interval():
     return date_list
 
 
+def yesterday():
+    """
+    :return: yesterday's date in 'YYYY-MM-DD' format
+    """
+    return (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
 def set_bigshare_dir(date):
     """
     Check if proper folder exists. If not - creates it.
@@ -235,9 +250,26 @@ def is_in_polygon(X, Y, polygon):
     min_polygon_Y = min(point['Y'] for point in polygon)
     if X < min_polygon_X or X > max_polygon_X or Y < min_polygon_Y or Y > max_polygon_Y:
         return False
-    flat_polygon = [list(dct.values()) for dct in polygon]  # list of dicts -> list of lists
-    path = mpltPath.Path(flat_polygon)
-    return path.contains_point([X, Y])
+    return contains_point(X, Y, polygon)
+
+
+def contains_point(X, Y, polygon):
+    """
+    Even-odd (ray casting) point-in-polygon test. Replaces matplotlib's Path.contains_point,
+    so matplotlib isn't needed at all. Points exactly on the border may go either way.
+    :X: x coordinate of the point
+    :Y: y coordinate of the point
+    :polygon: list of dicts with a points of vertices of the polygon (closed or not)
+    :return: True / False
+    """
+    inside = False
+    prev = polygon[-1]
+    for point in polygon:
+        if (point['Y'] > Y) != (prev['Y'] > Y) and \
+                X < (prev['X'] - point['X']) * (Y - point['Y']) / (prev['Y'] - point['Y']) + point['X']:
+            inside = not inside
+        prev = point
+    return inside
 
 
 def manual_logging_timedelta(load_start_time):
@@ -0,0 +1,55 @@
+"""
+arrow_compute.py contains pyarrow.compute version of the heaviest string step of dataframe_transformations:
+empty strings -> NaN replacement over the whole dataframe. The mask is computed natively on Arrow arrays
+(no Python objects per value, no regex), only matching cells are replaced, so the output stays the same
+as in the pandas path. Columns Arrow can't handle (mixed types) silently go through the pandas path.
+Strip, dictionary mapping and regex replace of single columns stay in pandas: converting a column
+to Arrow and back costs more than the operation itself. pyarrow is imported only when it is used.
+"""
+import numpy as np
+
+
+def _pyarrow():
+    """
+    :return: (pyarrow, pyarrow.compute) modules
+    """
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise RuntimeError("Arrow compute engine needs 'pyarrow' package (pip install pyarrow)")
+    return pyarrow, pyarrow.compute
+
+
+def _string_array(series):
+    """
+    :param series: Pandas Series
+    :return: pyarrow string Array or None if the series isn't a pure string column
+    """
+    pa, _ = _pyarrow()
+    try:
+        return pa.array(series, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def empty_to_nan(df):
+    """
+    Same as df.replace(r'^\\s*$', np.NaN, regex=True): empty and whitespace-only strings become NaN
+    :param df: Pandas DataFrame
+    :return: new Pandas DataFrame
+    """
+    _, pc = _pyarrow()
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        array = _string_array(df[column])
+        if array is None:  # mixed column (dates, numbers and strings) - pandas path
+            df[column] = df[column].replace(r'^\s*$', np.NaN, regex=True)
+            continue
+        # not a '^\s*$' regex: RE2 \s is ASCII only, while Python's matches any str.isspace() character
+        empty = pc.fill_null(pc.or_(pc.equal(pc.utf8_length(array), 0), pc.utf8_is_space(array)), False)
+        if pc.any(empty).as_py():
+            df[column] = df[column].where(~empty.to_numpy(zero_copy_only=False), np.NaN)
+    return df
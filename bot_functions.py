@@ -1,5 +1,7 @@
 import logging
 
+from progress import progress
+
 def start(update, context):
     context.bot.send_message(chat_id=update.effective_chat.id, text="Восславим господа нашего, Омниссию!")
     logger = logging.getLogger(__name__)
@@ -11,12 +13,28 @@ def helper(update, context):
     chat_id = update.message.chat_id
     text = "Available commands:\n" \
            "/start - starts bot\n" \
-           "/status - checks if bot is still alive\n" \
-           "/stop - disables bot"
+           "/status - shows progress of the current load (or results of the last one)\n" \
+           "/stop - stops the current load before its next stage"
     context.bot.send_message(chat_id=chat_id, text=text)
 
 
+def status(update, context):
+    """Sends live telemetry of the loader: date, stage, rows, rows/sec, elapsed time, ETA and stage timings"""
+    context.bot.send_message(chat_id=update.effective_chat.id, text=progress.summary())
+
+
+def stop(update, context):
+    """Asks the running load to stop between stages"""
+    logger = logging.getLogger(__name__)
+    if progress.request_stop():
+        logger.info("LOAD STOP requested by " + update.message.from_user.first_name)
+        text = "Выгрузка остановится перед следующим этапом"
+    else:
+        text = "Сейчас ничего не выгружается"
+    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
 def error(update, context):
     """Log Errors caused by Updates."""
     logger = logging.getLogger(__name__)
-    logger.warning('Update "%s" caused error "%s"', update, context.error)
\ No newline at end of file
+    logger.warning('Update "%s" caused error "%s"', update, context.error)
@@ -0,0 +1,105 @@
+"""
+compressed_csv.py writes DataFrames to gzip or zstd compressed CSV.
+DataFrame is serialized by chunks of rows, and chunks are compressed in background threads
+while the next chunks are formatted, so compression overlaps with formatting.
+gzip: every chunk becomes an independent gzip member (like pigz), members are compressed in a thread pool.
+Concatenated members are a valid gzip file for gzip, pandas.read_csv and Excel/Qlik importers.
+zstd: one zstd frame, compressed by zstd's own worker threads. Needs 'zstandard' package.
+"""
+import gzip
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSIONS = {  # name: (file extension, default level)
+    'gzip': ('gz', 6),
+    'zstd': ('zst', 3),
+}
+CHUNK_ROWS = 50000
+
+
+def _csv_chunks(df, chunk_rows, **to_csv_kwargs):
+    """
+    Serializes DataFrame to CSV by chunks of rows
+    :param df: Pandas DataFrame
+    :param chunk_rows: rows in one chunk
+    :param to_csv_kwargs: arguments of DataFrame.to_csv (sep, index...)
+    :return: generator of bytes (utf-8), header is in the first chunk only
+    """
+    if df.empty:
+        yield df.to_csv(**to_csv_kwargs).encode('utf-8')
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(header=(start == 0), **to_csv_kwargs).encode('utf-8')
+
+
+def _write_gzip(chunks, file, level, threads):
+    """
+    Compresses chunks in a thread pool (zlib releases GIL) and writes gzip members in order
+    :param chunks: iterable of bytes
+    :param file: binary file object
+    :param level: gzip level, 1-9
+    :param threads: number of compressing threads
+    :return: None
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(gzip.compress, chunk, level))
+            if len(in_flight) > 2 * threads:  # bounded memory: don't run too far ahead of the writer
+                file.write(in_flight.popleft().result())
+        while in_flight:
+            file.write(in_flight.popleft().result())
+
+
+def _write_zstd(chunks, file, level, threads):
+    """
+    Streams chunks to zstd compressor with its own worker threads
+    :param chunks: iterable of bytes
+    :param file: binary file object
+    :param level: zstd level, 1-22
+    :param threads: number of zstd worker threads
+    :return: None
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs 'zstandard' package (pip install zstandard)")
+    compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+    with compressor.stream_writer(file, closefd=False) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+def compressed_extension(compression):
+    """
+    :param compression: 'gzip' or 'zstd'
+    :return: file extension to add after '.csv'
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression "{compression}", choose from {", ".join(COMPRESSIONS)}')
+    return COMPRESSIONS[compression][0]
+
+
+def write_compressed_csv(df, path, compression='gzip', level=None, threads=None, chunk_rows=CHUNK_ROWS,
+                         **to_csv_kwargs):
+    """
+    Writes DataFrame to compressed CSV file
+    :param df: Pandas DataFrame
+    :param path: full file path (extension isn't added here)
+    :param compression: 'gzip' or 'zstd'
+    :param level: compression level, default from COMPRESSIONS
+    :param threads: number of compressing threads, number of CPUs by default
+    :param chunk_rows: rows in one serialized chunk
+    :param to_csv_kwargs: arguments of DataFrame.to_csv (sep, index...)
+    :return: None
+    """
+    compressed_extension(compression)  # validates compression name
+    level = COMPRESSIONS[compression][1] if level is None else level
+    threads = threads or os.cpu_count() or 1
+    chunks = _csv_chunks(df, chunk_rows, **to_csv_kwargs)
+    with open(path, 'wb') as file:
+        if compression == 'gzip':
+            _write_gzip(chunks, file, level=level, threads=threads)
+        else:
+            _write_zstd(chunks, file, level=level, threads=threads)
@@ -4,36 +4,45 @@ and geographic Pandas dataframes).
 and get_geozones function.
 """
 import logging
+import os
+from functools import partial
 
 import numpy as np
 import pandas as pd
 
 import TK_utils as tk_u
+import arrow_compute
+import compressed_csv
+import payout_rules
 import renaming_dicts
 import secrets
+import zone_cache as z_c
 
+UNFORMED_DUPLICATES = ['Дата', 'Время', 'phone']  # one unformed order per client and second
 
-def modify_and_save_pins(df, car_classes_df, cities_df, geo_df, date):
+
+def modify_and_save_pins(df, dims, geo_df, date, save=True, compute_engine='pandas', zone_cache=None,
+                         **save_options):
     """
     Transforms and saves to file pins dataframe
     :param df: Pandas DataFrame with pins
-    :param car_classes_df: Pandas DataFrame with car classes codes and names
-    :param cities_df: Pandas DataFrame with cities id's and names
+    :param dims: DimensionRegistry with car classes and cities lookups
     :param geo_df: Pandas DataFrame with geo zones names, their boundary points and city names
     :param date: date to load in "YYYY-MM-DD" format
-    :return: None, but saving file to local network server "//bigshare/Выгрузки ТФ/Выгрузки My_TK/'year'/'month'"
+    :param save: if False - only transforms, file is saved later by save_dataframe
+    :param compute_engine: 'pandas' or 'arrow' - engine for empty strings replacement
+    :param zone_cache: z_c.ZoneCache shared by get_zone passes, None - no caching
+    :param save_options: output options for save_dataframe (output_dir, fmt, compression, compression_level)
+    :return: transformed dataframe. Also saves it to file on local network server (see save_dataframe)
     """
-    # Merge car classes
-    df = df.merge(car_classes_df, left_on='type_auto', right_on='id', how='left')  # retrieve car classes names
-    df.drop(columns=['type_auto', 'id'], inplace=True)  # cleaning after merge
-    df.rename({'name': 'type_auto'}, axis='columns', inplace=True)  # cleaning after merge
-    # Merge with cities names df and drop non-taxi entries
-    df = df.merge(cities_df, left_on='city', right_on='id', how='left')
-    df = df[df.type.str.startswith('taxi', na=False)]
-    df.drop(columns=['id', 'type', 'city', 'to_local_time_corr'], inplace=True)
-    df.rename(columns={'name': 'city'}, inplace=True)
-    # Add 'Регион' field
-    df['Регион'] = df.city.map(secrets.region_dict)
+    # Drop non-taxi entries; car classes and cities go to the end, as after merge (selected at once, no extra copy)
+    columns = [column for column in df.columns if column not in ('type_auto', 'city')] + ['type_auto', 'city']
+    df = df.loc[dims.taxi_mask(df.city), columns].reset_index(drop=True)
+    # Car classes names, cities names and 'Регион' field (in place)
+    df['type_auto'] = dims.class_name(df.type_auto)
+    city_ids = df.city.to_numpy()
+    df['city'] = dims.city_name(city_ids)
+    df['Регион'] = dims.region(city_ids)
     # Incoming source mapping
     df['come_from'] = df.come_from.map(renaming_dicts.incoming_type)
     # Separate 'date' column to date and time
@@ -43,7 +52,7 @@ def modify_and_save_pins(df, car_classes_df, cities_df, geo_df, date):
     df.drop(columns='dat', inplace=True)
     # Map geo zones
     df.rename(columns={'x': 'x_in', 'y': 'y_in'}, inplace=True)
-    get_zone(df=df, geozone_df=geo_df, mode='in')
+    get_zone(df=df, geozone_df=geo_df, mode='in', cache=zone_cache)
     # Generate key field
     df['Номер_пина'] = df.Дата.astype(str).str.replace('-', '', regex=True).apply(lambda x: x[-4:]) + \
                        df.Время.astype(str).str.replace(':', '', regex=True) + \
@@ -51,23 +60,26 @@ def modify_and_save_pins(df, car_classes_df, cities_df, geo_df, date):
     # Final renaming, dropping and saving
     df.rename(renaming_dicts.pin, axis='columns', inplace=True)
     df['Статус'] = 'Пин'
-    df = df.replace(r'^\s*$', np.NaN, regex=True)  # replace all empty strings with NaNs
+    df = _empty_to_nan(df, compute_engine)  # replace all empty strings with NaNs
     # df.to_csv(f"data/{date}_пины.csv", sep=';', index=False)
-    saving_path = tk_u.set_bigshare_dir(date)
-    df.to_csv(
-        f"{saving_path}/{date}_пины.csv",
-        sep=';', index=False)
+    if save:
+        save_dataframe(df, date=date, suffix='пины', **save_options)
+    return df
 
 
-def modify_and_save_unformed(df, car_classes_df, cities_df, geo_df, date):
+def modify_and_save_unformed(df, dims, geo_df, date, save=True, compute_engine='pandas', zone_cache=None,
+                             **save_options):
     """
     Transforms and saves to file unformed orders dataframe
     :param df: Pandas DataFrame with unformed orders
-    :param car_classes_df: Pandas DataFrame with car classes codes and names
-    :param cities_df: Pandas DataFrame with cities id's and names
+    :param dims: DimensionRegistry with car classes and cities lookups
     :param geo_df: Pandas DataFrame with geo zones names, their boundary points and city names
     :param date: date to load in "YYYY-MM-DD" format
-    :return: None, but saving file to local network server "//bigshare/Выгрузки ТФ/Выгрузки My_TK/'year'/'month'"
+    :param save: if False - only transforms, file is saved later by save_dataframe
+    :param compute_engine: 'pandas' or 'arrow' - engine for empty strings replacement
+    :param zone_cache: z_c.ZoneCache shared by get_zone passes, None - no caching
+    :param save_options: output options for save_dataframe (output_dir, fmt, compression, compression_level)
+    :return: transformed dataframe. Also saves it to file on local network server (see save_dataframe)
     """
     df['points'] = df['points'].apply(len)  # transitional points list to len of that list
     df['type_auto'] = df.type_auto.astype(int)
@@ -87,31 +99,28 @@ def modify_and_save_unformed(df, car_classes_df, cities_df, geo_df, date):
                                 axis=1)  # axis ==1 => apply to each row
 
     df['autos_time'] = pd.array(df.autos_time, dtype=pd.Int16Dtype())
-    # Merge with car classes
-    df = df.merge(car_classes_df, left_on='type_auto', right_on='id', how='left')  # retrieve car classes names
-    df.drop(columns=['type_auto', 'id'], inplace=True)  # cleaning after merge
-    df.rename({'name': 'type_auto'}, axis='columns', inplace=True)  # cleaning after merge
-    # Merge with cities names df and drop non-taxi entries
-    df = df.merge(cities_df, left_on='city', right_on='id', how='left', suffixes=('', '_source'))
-    df = df[df.type_source.str.startswith('taxi', na=False)]
-    df.drop(columns=['id', 'type_source', 'city', 'to_local_time_corr'], inplace=True)
-    df.rename(columns={'name': 'city'}, inplace=True)
-    # Add 'Регион' field
-    df['Регион'] = df.city.map(secrets.region_dict)
+    # Drop non-taxi entries; car classes and cities go to the end, as after merge (selected at once, no extra copy)
+    columns = [column for column in df.columns if column not in ('type_auto', 'city')] + ['type_auto', 'city']
+    df = df.loc[dims.taxi_mask(df.city), columns].reset_index(drop=True)
+    # Car classes names, cities names and 'Регион' field (in place)
+    df['type_auto'] = dims.class_name(df.type_auto)
+    city_ids = df.city.to_numpy()
+    df['city'] = dims.city_name(city_ids)
+    df['Регион'] = dims.region(city_ids)
     # Separate 'date' column to date and time
     df['date'] = pd.to_datetime(df.date)
     new_dates, new_times = zip(*[(d.date(), d.time()) for d in df['date']])
     df = df.assign(Дата=new_dates, Время=new_times)
     df.drop(columns='date', inplace=True)
     # Drop duplicates!
-    df.drop_duplicates(subset=['Дата', 'Время', 'phone'], ignore_index=True, inplace=True)
+    df.drop_duplicates(subset=UNFORMED_DUPLICATES, ignore_index=True, inplace=True)
     # Incoming source mapping
     df['type'] = df.type.map(renaming_dicts.incoming_type)
     # Get rid of possible bug entries
     df = df[df.x_in != 0.]
     # Map geo zones
-    get_zone(df=df, geozone_df=geo_df, mode='in')
-    get_zone(df=df, geozone_df=geo_df, mode='out')
+    get_zone(df=df, geozone_df=geo_df, mode='in', cache=zone_cache)
+    get_zone(df=df, geozone_df=geo_df, mode='out', cache=zone_cache)
     # Generate key field: MMDDhhmmss&id (or &phone[-7:] if id == 0)
     df['Номер_неоформленного'] = np.where(
         df.id_client == 0,
@@ -126,24 +135,27 @@ def modify_and_save_unformed(df, car_classes_df, cities_df, geo_df, date):
     df.drop(columns=['option_1', 'option_2', 'option_3',
                      'c_auto_all', 'proc_a_in_all', 'id_user'], inplace=True)
     df['Статус'] = 'Неоформленный'
-    df = df.replace(r'^\s*$', np.NaN, regex=True)  # replace all empty strings with NaNs
+    df = _empty_to_nan(df, compute_engine)  # replace all empty strings with NaNs
     # df.to_csv(f"data/{date}_неоф.csv", sep=';', index=False)
-    saving_path = tk_u.set_bigshare_dir(date)
-    df.to_csv(
-        f"{saving_path}/{date}_неоф.csv",
-        sep=';', index=False)
+    if save:
+        save_dataframe(df, date=date, suffix='неоф', **save_options)
+    return df
 
 
-def modify_and_save_orders(df, car_classes_df, cities_df, options_df, geo_df, date):
+def modify_and_save_orders(df, dims, options_df, geo_df, date, save=True, compute_engine='pandas', zone_cache=None,
+                           **save_options):
     """
     Transforms and saves to file orders dataframe
     :param df: Pandas DataFrame with orders
-    :param car_classes_df: Pandas DataFrame with car classes codes and names
-    :param cities_df: Pandas DataFrame with cities id's and names
+    :param dims: DimensionRegistry with car classes and cities lookups
     :param options_df: Pandas DataFrame with options id's and names
     :param geo_df: Pandas DataFrame with geo zones names, their boundary points and city names
     :param date: date to load in "YYYY-MM-DD" format
-    :return: None, but saving file to local network server "//bigshare/Выгрузки ТФ/Выгрузки My_TK/'year'/'month'"
+    :param save: if False - only transforms, file is saved later by save_dataframe
+    :param compute_engine: 'pandas' or 'arrow' - engine for empty strings replacement
+    :param zone_cache: z_c.ZoneCache shared by get_zone passes, None - no caching
+    :param save_options: output options for save_dataframe (output_dir, fmt, compression, compression_level)
+    :return: transformed dataframe. Also saves it to file on local network server (see save_dataframe)
     """
     df.drop(columns=['id_user_out', 'name_type_auto',
                      # * CONSTANTS.gruz_fields,
@@ -168,18 +180,17 @@ def modify_and_save_orders(df, car_classes_df, cities_df, options_df, geo_df, da
     df['Дата и время подачи'] = df.dat.astype(str) + ' ' + df.time_
     df['Дата и время подачи'] = pd.to_datetime(df['Дата и время подачи'])
     df['Дата и время подачи'] = df['Дата и время подачи'].dt.strftime('%d.%m.%Y %H:%M')
-    # Merge with cities names df, drop non-taxi entries, cast moscow time to local
+    # Drop non-taxi entries, cast moscow time to local, cities names and 'Регион' field
     df['city_'] = df.city_.fillna(0).astype(int)  # missed values has id equal 0 (Saint-Petersburg)
-    df = df.merge(cities_df, left_on='city_', right_on='id', how='left', suffixes=('', '_source'))
-    df = df[df.type.str.startswith('taxi', na=False)]
-    df = df.apply(
-        lambda x: x + df.to_local_time_corr
-        if x.name in ['dat_add', 'dat_out', 'driver_dat_a_in',
-                      'ed_22', 'dat_close', 'dat_cancel'] else x)
-    df.drop(columns=['id_source', 'type', 'city_', 'to_local_time_corr'], inplace=True)
-    df.rename(columns={'name': 'city'}, inplace=True)
-    # Add 'Регион' field
-    df['Регион'] = df.city.map(secrets.region_dict)
+    columns = [column for column in df.columns if column != 'city_'] + ['city_']  # cities go to the end, as after merge
+    df = df.loc[dims.taxi_mask(df.city_), columns].reset_index(drop=True)
+    to_local_time_corr = dims.time_zone_corr(df.city_)
+    for col in ['dat_add', 'dat_out', 'driver_dat_a_in', 'ed_22', 'dat_close', 'dat_cancel']:
+        df[col] = df[col] + to_local_time_corr
+    city_ids = df.city_.to_numpy()
+    df['city_'] = dims.city_name(city_ids)
+    df.rename(columns={'city_': 'city'}, inplace=True)
+    df['Регион'] = dims.region(city_ids)
     # Coords type cast and drop entries with empty coords
     df.rename(columns={'x_out_': 'x_out', 'y_out_': 'y_out'}, inplace=True)
     df.drop(df[df.x_in == ''].index, axis=0, inplace=True)
@@ -206,59 +217,16 @@ def modify_and_save_orders(df, car_classes_df, cities_df, options_df, geo_df, da
     # replace all values in columns with the value of 10th/1st bit
     df['warn'] = df.warn.apply(tk_u.is_bit_setted, args=(10,))
     df['dr_opt'] = df.dr_opt.apply(tk_u.is_bit_setted, args=(1,))
-    # Driver's part
-    # Tips (5%, 10% and 15%) included. We can't count them separately without API improvement
-    # 1. Private drivers and our drivers with car is in 'раскат' [1st bit of DR_OPT is set]
-    # 1.1 Add (order's and paid waiting's cost) to p_driver_s IF:
-    # payment type is 'Наличный' OR 'Залог' OR ('Картой вод' AND driver has personal terminal) [10th bit of WARN is set]
-    df['p_driver_s'] = np.where(
-        ((df.our_driver != '0') | ((df.our_driver == '0') & df.dr_opt)) &
-        ((df.type_money == '0') |
-         (df.type_money == '2') |
-         (df.type_money == '12') |
-         ((df.type_money == '5') & df.warn)),
-        df.p_driver_s + df.c_auto + df.pp_sum,
-        df.p_driver_s)
-    # 1.2 Add (order's and paid services's cost) to p_driver_s IF:
-    # payment type 2 is 'Наличный' OR 'Залог'
-    # OR ('Картой вод' AND driver has personal terminal) [10th bit of WARN is set]
-    df['p_driver_s'] = np.where(
-        ((df.our_driver != '0') | ((df.our_driver == '0') & df.dr_opt)) &
-        ((df.type_money_b == '0') |
-         (df.type_money_b == '2') |
-         (df.type_money_b == '12') |
-         ((df.type_money_b == '5') & df.warn)),
-        df.p_driver_s + df.c_auto_b,
-        df.p_driver_s)
-    # 2 Cashless payment
-    # Subtract from p_driver_s paid services's cost IF payment type is 'Безнал'
-    df['p_driver_s'] = np.where(
-        ((df.type_money != '0') &
-         (df.type_money != '2') &
-         (df.type_money != '12') &
-         np.logical_not((df.type_money == '5') & df.warn)),
-        df.p_driver_s - df.p_auto,
-        df.p_driver_s)
-    # make part of the driver = 0 for cancelled orders
-    df['p_driver_s'] = np.where(df.status == '3', 0, df.p_driver_s)
-    # partner's part
+    # Driver's part and partner's part (see rules table in payout_rules.py)
     df['franch_perc'] = df.franch_perc.astype(float)
-    df['Часть_партнера'] = df.c_auto + df.c_auto_b - df.oper_pay
-    df.loc[df.c_auto_2 != -1, 'Часть_партнера'] = df.c_auto_2
-    df.loc[df.dr_minimum > df['Часть_партнера'], 'Часть_партнера'] = df.dr_minimum
-    df['Часть_партнера'] = df['Часть_партнера'] + df.pp_sum
-    df['Часть_партнера'] = round((df['Часть_партнера'] * df.franch_perc) / 100)
-    # Required auto type merge
-    df['type_auto'] = df.type_auto.astype(int)
-    df = df.merge(car_classes_df, left_on='type_auto', right_on='id', how='left', suffixes=('', '_classes'))
-    df.drop(columns=['type_auto', 'id_classes'], inplace=True)  # cleaning after merge
-    df.rename({'name': 'type_auto'}, axis='columns', inplace=True)  # cleaning after merge
-    # Executed auto type merge
-    df['c_type_auto'] = df.c_type_auto.fillna(-1)
-    df['c_type_auto'] = df.c_type_auto.astype(int)
-    df = df.merge(car_classes_df, left_on='c_type_auto', right_on='id', how='left', suffixes=('', '_classes'))
-    df.drop(columns=['c_type_auto', 'id_classes'], inplace=True)
-    df.rename(columns={'name': 'c_type_auto'}, inplace=True)
+    payout_rules.apply_payout_rules(df)
+    # Required auto type names
+    df['type_auto'] = dims.class_name(df.type_auto.astype(int))
+    # Executed auto type names
+    df['c_type_auto'] = dims.class_name(df.c_type_auto.fillna(-1).astype(int))  # -1 has no class => NaN
+    # Car classes go to the end, as after merge (one column reindex for both)
+    df = df[[column for column in df.columns if column not in ('type_auto', 'c_type_auto')] +
+            ['type_auto', 'c_type_auto']]
     # Order options merge
     df['option_1'] = df.option_1.fillna('0').apply(int, base=2)
     df['option_2'] = df.option_2.fillna('0').apply(int, base=2)
@@ -296,18 +264,88 @@ def modify_and_save_orders(df, car_classes_df, cities_df, options_df, geo_df, da
     df = df[df.x_in != 0.]
     df = df[df.x_out != 0.]
     # Map geo zones
-    get_zone(df=df, geozone_df=geo_df, mode='in')
-    get_zone(df=df, geozone_df=geo_df, mode='out')
+    get_zone(df=df, geozone_df=geo_df, mode='in', cache=zone_cache)
+    get_zone(df=df, geozone_df=geo_df, mode='out', cache=zone_cache)
     # Final renaming, dropping and saving
     df.rename(renaming_dicts.orders, axis='columns', inplace=True)
     df.drop(columns=['a_in', 'a_in_house', 'a_out', 'a_out_house', 'stat_opt', 't_work',
                      'option_1', 'option_2', 'option_3', 'opt_4', 'warn', 'dr_opt', 'franch_perc'], inplace=True)
-    df.replace(r'^\s*$', np.NaN, regex=True, inplace=True)  # replace all empty strings with NaNs
+    df = _empty_to_nan(df, compute_engine)  # replace all empty strings with NaNs
     # df.to_csv(f"data/{date}_заказы.csv", sep=';', index=False)
-    saving_path = tk_u.set_bigshare_dir(date)
-    df.to_csv(
-        f"{saving_path}/{date}_заказы.csv",
-        sep=';', index=False)
+    if save:
+        save_dataframe(df, date=date, suffix='заказы', **save_options)
+    return df
+
+
+def transform_dataset(name, df, dims, geo_df, options_df, date, engine=None, compute_engine='pandas',
+                      zone_cache=None):
+    """
+    Calls transform function of the dataset (without saving)
+    :param name: dataset name - 'unformed', 'pins' or 'orders'
+    :param df: raw Pandas DataFrame of the dataset
+    :param dims: DimensionRegistry with car classes and cities lookups
+    :param geo_df: Pandas DataFrame with geo zones names, their boundary points and city names
+    :param options_df: Pandas DataFrame with options id's and names (used for orders only)
+    :param date: date to load in "YYYY-MM-DD" format
+    :param engine: dict {dataset name: transform function with modify_and_save_* signature}, CURRENT_ENGINE by default
+    :param compute_engine: one of COMPUTE_ENGINES
+    :param zone_cache: z_c.ZoneCache for get_zone, None - no caching
+    :return: transformed dataframe
+    """
+    if compute_engine not in COMPUTE_ENGINES:
+        raise ValueError(f'Unknown compute engine "{compute_engine}", choose from {", ".join(COMPUTE_ENGINES)}')
+    engine = CURRENT_ENGINE if engine is None else engine
+    if name == 'orders':
+        return engine[name](df, dims=dims, options_df=options_df, geo_df=geo_df, date=date, save=False,
+                            compute_engine=compute_engine, zone_cache=zone_cache)
+    return engine[name](df, dims=dims, geo_df=geo_df, date=date, save=False, compute_engine=compute_engine,
+                        zone_cache=zone_cache)
+
+
+COMPUTE_ENGINES = ('pandas', 'arrow')  # 'arrow' needs pyarrow, see arrow_compute.py
+# Only empty strings replacement goes through Arrow: strip, map and regex replace of single object columns
+# were not faster there, as converting to Arrow and back costs more than the operation itself
+
+
+def _empty_to_nan(df, compute_engine):
+    """Replaces all empty (and whitespace-only) strings with NaNs by the selected compute engine"""
+    if compute_engine == 'arrow':
+        return arrow_compute.empty_to_nan(df)
+    return df.replace(r'^\s*$', np.NaN, regex=True)
+
+
+SAVE_FORMATS = {  # format name: (file extension, function(df, path))
+    'csv': ('csv', lambda df, path: df.to_csv(path, sep=';', index=False)),
+    'parquet': ('parquet', lambda df, path: df.to_parquet(path, index=False)),  # needs pyarrow
+    'pickle': ('pkl', lambda df, path: df.to_pickle(path)),
+}
+
+
+def save_dataframe(df, date, suffix, output_dir=None, fmt='csv', compression=None, compression_level=None):
+    """
+    Saves transformed dataframe to local network server "//bigshare/Выгрузки ТФ/Выгрузки My_TK/'year'/'month'"
+    :param df: transformed Pandas DataFrame (pins, unformed or orders)
+    :param date: loaded date in "YYYY-MM-DD" format
+    :param suffix: dataset name in the filename ('пины', 'неоф' or 'заказы')
+    :param output_dir: save to this folder instead of bigshare (created if not exists)
+    :param fmt: one of SAVE_FORMATS, 'csv' by default
+    :param compression: None, 'gzip' or 'zstd' - only for csv. Adds '.gz'/'.zst' to the filename
+    :param compression_level: compression level, default from compressed_csv.COMPRESSIONS
+    :return: None
+    """
+    extension, writer = SAVE_FORMATS[fmt]
+    if compression is not None:
+        if fmt != 'csv':
+            raise ValueError(f'Compression is supported only for csv, not for {fmt}')
+        extension += '.' + compressed_csv.compressed_extension(compression)
+        writer = partial(compressed_csv.write_compressed_csv, compression=compression, level=compression_level,
+                         sep=';', index=False)
+    if output_dir is None:
+        saving_path = tk_u.set_bigshare_dir(date)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+        saving_path = output_dir
+    writer(df, f"{saving_path}/{date}_{suffix}.{extension}")
 
 
 def get_geozones(df, cities_df):
@@ -331,12 +369,13 @@ def get_geozones(df, cities_df):
     return df
 
 
-def get_zone(df, geozone_df, mode='in'):
+def get_zone(df, geozone_df, mode='in', cache=None):
     """
     Calculates zone for given X and Y coordinates depends on mode and creates column 'Название зоны...'.
     :df: df for creating new geoname column (pin_unf_df/orders_df)
     :geozone_df: df with decompressed boundaries, city and geozone names
     :mode: 'in' - generates 'Название зоны подачи', 'out' - generates 'Название зоны назначения'. Default 'in'
+    :cache: z_c.ZoneCache for polygon tests results, None - no caching
     :return: None
     """
     logger = logging.getLogger(__name__)
@@ -374,19 +413,26 @@ def get_zone(df, geozone_df, mode='in'):
             point_y = row.loc['y_out']
         else:
             raise ValueError('Unknown mode!')
-        # calculations:
-        for tmp_idx, tmp_row in city_slice.iterrows():
-            if tk_u.is_in_polygon(X=point_x, Y=point_y, polygon=city_slice.loc[tmp_idx, 'compressed_boundary']):
-                if mode == 'in':
-                    df.loc[idx, 'Название зоны подачи'] = city_slice.loc[tmp_idx, 'geozone']
-                if mode == 'out':
-                    df.loc[idx, 'Название зоны назначения'] = city_slice.loc[tmp_idx, 'geozone']
-                break
-        else:  # runs if for loop ends w/o break => without finding proper polygon
-            if mode == 'in':
-                df.loc[idx, 'Название зоны подачи'] = row.loc['city'] + ' (неразмеч. зона)'
-            if mode == 'out':
-                df.loc[idx, 'Название зоны назначения'] = row.loc['city'] + ' (неразмеч. зона)'
+        # calculations (or zone from cache, if the same point of the city was already tested):
+        cache_key = None
+        zone = z_c.MISSING
+        if cache is not None and not (pd.isna(point_x) or pd.isna(point_y)):
+            cache_key = z_c.zone_key(row.city, point_x, point_y)
+            zone = cache.get(cache_key)
+        if zone is z_c.MISSING:
+            zone = None
+            for tmp_idx, tmp_row in city_slice.iterrows():
+                if tk_u.is_in_polygon(X=point_x, Y=point_y, polygon=city_slice.loc[tmp_idx, 'compressed_boundary']):
+                    zone = city_slice.loc[tmp_idx, 'geozone']
+                    break
+            if cache_key is not None:
+                cache.put(cache_key, zone)
+        if zone is None:  # without finding proper polygon
+            zone = row.loc['city'] + ' (неразмеч. зона)'
+        if mode == 'in':
+            df.loc[idx, 'Название зоны подачи'] = zone
+        if mode == 'out':
+            df.loc[idx, 'Название зоны назначения'] = zone
     # logger.info(f"df with size {df.size} mapped with zones in '{mode}' mode")
 
 
@@ -444,3 +490,36 @@ def extract_unf_car_time(type_auto, autos_time):
         if dct['id_auto'] == temp:
             return dct['time']
     return np.NaN
+
+
+CURRENT_ENGINE = {  # dataset name: transform function
+    'unformed': modify_and_save_unformed,
+    'pins': modify_and_save_pins,
+    'orders': modify_and_save_orders,
+}
+
+NATURAL_KEYS = {  # dataset name: key column candidates in the transformed dataframe (first found is used)
+    'orders': ['id', 'Номер'],
+    'pins': ['Номер_пина'],
+    'unformed': ['Номер_неоформленного'],
+}
+
+
+def natural_key(name, df):
+    """
+    Finds natural key column of the transformed dataset
+    :param name: dataset name - 'unformed', 'pins' or 'orders'
+    :param df: transformed Pandas DataFrame
+    :return: key column name
+    """
+    for column in NATURAL_KEYS[name]:
+        if column in df.columns:
+            return column
+    raise KeyError(f'No natural key {NATURAL_KEYS[name]} in {name} dataframe')
+
+
+def unformed_duplicates_subset():
+    """
+    :return: UNFORMED_DUPLICATES columns as named in the transformed (renamed) unformed dataframe
+    """
+    return [renaming_dicts.unf.get(column, column) for column in UNFORMED_DUPLICATES]
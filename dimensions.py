@@ -0,0 +1,88 @@
+"""
+dimensions.py contains DimensionRegistry - integer-indexed lookup tables for car classes and cities.
+It is built once per load and replaces repeated DataFrame merges in dataframe_transformations
+with array 'take' operations (no frame copies, no drop/rename cleanup after merge).
+"""
+import numpy as np
+import pandas as pd
+
+import secrets
+
+
+def _dense_table(ids, values, fill, dtype=object):
+    """
+    Builds dense array where value for id N is stored at position N
+    :param ids: iterable with non-negative integer ids
+    :param values: iterable with values for those ids
+    :param fill: value for ids absent in the source table
+    :param dtype: numpy dtype of the resulting array
+    :return: numpy array with length max(id) + 1
+    """
+    ids = np.asarray(ids, dtype='int64')
+    values = np.asarray(values, dtype=dtype)
+    mask = ids >= 0  # negative ids can't be stored - they will be looked up as missing
+    size = int(ids[mask].max()) + 1 if mask.any() else 0
+    table = np.full(size, fill, dtype=dtype)
+    table[ids[mask]] = values[mask]
+    return table
+
+
+class DimensionRegistry:
+    """
+    Dense id-indexed arrays with class names, city names, city types, time zone corrections and regions.
+    Lookups behave like a left merge: unknown or missing ids give NaN (NaT for time corrections)
+    """
+
+    def __init__(self, car_classes_df, cities_df):
+        """
+        :param car_classes_df: Pandas DataFrame with car classes codes and names
+        :param cities_df: Pandas DataFrame with cities id's, names, types and 'to_local_time_corr' field
+        """
+        self.class_names = _dense_table(car_classes_df.id, car_classes_df.name, fill=np.NaN)
+        self.city_names = _dense_table(cities_df.id, cities_df.name, fill=np.NaN)
+        self.city_types = _dense_table(cities_df.id, cities_df.type, fill=np.NaN)
+        self.time_zone_corrs = _dense_table(cities_df.id, cities_df.to_local_time_corr,
+                                            fill=np.timedelta64('NaT'), dtype='timedelta64[ns]')
+        self.regions = _dense_table(cities_df.id, cities_df.name.map(secrets.region_dict), fill=np.NaN)
+        self.is_taxi = _dense_table(cities_df.id, cities_df.type.str.startswith('taxi', na=False),
+                                    fill=False, dtype=bool)
+
+    @staticmethod
+    def _take(table, ids, fill):
+        """
+        Vectorized lookup of ids in the dense table
+        :param table: one of the registry arrays
+        :param ids: Series/array with ids (may contain NaNs, empty strings or unknown ids)
+        :param fill: value for missing ids
+        :return: numpy array with the same length as ids
+        """
+        codes = pd.to_numeric(pd.Series(ids), errors='coerce').to_numpy(dtype='float64')
+        with np.errstate(invalid='ignore'):
+            valid = (codes >= 0) & (codes < len(table))  # NaN comparisons are False
+        result = np.full(len(codes), fill, dtype=table.dtype)
+        result[valid] = table[codes[valid].astype('int64')]
+        return result
+
+    def class_name(self, ids):
+        """Car class names for given car class ids"""
+        return self._take(self.class_names, ids, fill=np.NaN)
+
+    def city_name(self, ids):
+        """City names for given city ids"""
+        return self._take(self.city_names, ids, fill=np.NaN)
+
+    def city_type(self, ids):
+        """City types for given city ids"""
+        return self._take(self.city_types, ids, fill=np.NaN)
+
+    def time_zone_corr(self, ids):
+        """Moscow -> local time corrections (timedelta64) for given city ids"""
+        return self._take(self.time_zone_corrs, ids, fill=np.timedelta64('NaT'))
+
+    def region(self, ids):
+        """'Регион' values for given city ids"""
+        return self._take(self.regions, ids, fill=np.NaN)
+
+    def taxi_mask(self, ids):
+        """Boolean mask: True if city is a taxi city (type starts with 'taxi'), False for unknown ids"""
+        return self._take(self.is_taxi, ids, fill=False)
@@ -0,0 +1,54 @@
+"""
+import_benchmark.py measures cold-start import time of the project modules.
+Every module is imported in a fresh interpreter with 'python -X importtime', so nothing is cached.
+Exits with code 1 if some module is slower than the budget or pulls in heavy optional modules,
+which must be imported lazily (matplotlib, telegram, schedule, playsound).
+Usage: python import_benchmark.py [budget in ms, default 1500]
+"""
+import subprocess
+import sys
+
+MODULES = ['TK_utils', 'dataframe_transformations', 'manual_load', 'scheduled_load']
+LAZY_ONLY = ['matplotlib', 'telegram', 'schedule', 'playsound']
+REPEATS = 3
+
+
+def measure_import(module):
+    """
+    Imports module in a fresh interpreter
+    :param module: module name
+    :return: (cumulative import time in ms, set of top-level module names imported on the way)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Import of {module} failed:\n{result.stderr[-2000:]}')
+    cumulative_us = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        # line format: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == module:  # cumulative time of the module includes all its imports
+            cumulative_us = int(cumulative)
+        imported.add(name.strip().split('.')[0])
+    return cumulative_us / 1000, imported
+
+
+if __name__ == '__main__':
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 1500.
+    failed = False
+    for module in MODULES:
+        measures = [measure_import(module) for _ in range(REPEATS)]
+        best_ms = min(ms for ms, _ in measures)
+        heavy = sorted(set(LAZY_ONLY) & measures[0][1])
+        status = 'ok'
+        if best_ms > budget_ms:
+            status = 'SLOW'
+            failed = True
+        if heavy:
+            status = f'EAGER IMPORT OF {", ".join(heavy)}'
+            failed = True
+        print(f'{module:<28}{best_ms:>10.1f} ms   {status}')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,169 @@
+import argparse
+import logging
+from datetime import date as dt_date
+from time import sleep
+
+import pandas as pd
+
+import dataframe_transformations as df_t
+from manual_load import DATASETS, DATASET_NAMES, decode_date, fetch_date
+
+"""
+incremental_load.py contains intraday incremental load: the current day is polled every N minutes,
+and only new or changed rows are transformed and merged into the running day files.
+Orders: new or changed 'id' (raw rows are compared by hash), merge keeps the last version of an order,
+like drop_duplicates(subset='id', keep='last') in the transform.
+Pins and unformed: only unseen raw rows are transformed and appended (pins may share generated keys,
+so there is no dedup by key; unformed are deduplicated by date, time and phone over the whole day, as in the transform).
+Daily full load (scheduled_load.py) still rewrites the files of yesterday from scratch.
+"""
+
+
+def _row_hashes(df):
+    """
+    :param df: raw Pandas DataFrame (may contain lists and dicts)
+    :return: Series with one uint64 hash per row
+    """
+    return pd.util.hash_pandas_object(df.astype(str), index=False)
+
+
+class IncrementalDay:
+    """State of the running day: hashes of raw rows already transformed and the running transformed frames"""
+
+    def __init__(self, date, datasets=None):
+        """
+        :param date: date in "YYYY-MM-DD" format
+        :param datasets: names of datasets to load, all by default
+        """
+        self.date = date
+        self.datasets = DATASET_NAMES if datasets is None else datasets
+        self.order_hashes = pd.Series(dtype='uint64')  # raw order id: hash of its last version
+        self.seen_hashes = {name: set() for name in DATASET_NAMES}  # raw row hashes of pins and unformed
+        self.frames = {}  # dataset name: running transformed DataFrame
+
+    def _new_rows(self, name, raw_df):
+        """
+        Selects raw rows that weren't transformed yet (for orders - new or changed ids)
+        :param name: dataset name
+        :param raw_df: raw Pandas DataFrame of the whole day
+        :return: (raw rows to transform, ids to replace in the running frame - for orders only,
+        hashes to remember by _remember after successful merge)
+        """
+        if raw_df.empty or (name == 'orders' and 'id' not in raw_df.columns):  # nothing loaded yet today
+            return raw_df.iloc[0:0], set(), self.order_hashes if name == 'orders' else []
+        if name == 'orders':
+            raw_df = raw_df.drop_duplicates(subset='id', keep='last')
+            hashes = pd.Series(_row_hashes(raw_df).to_numpy(), index=raw_df['id'].astype(str).to_numpy())
+            known = hashes.index.isin(self.order_hashes.index)
+            changed = ~known
+            changed[known] = (self.order_hashes.reindex(hashes.index[known]).to_numpy() !=
+                              hashes[known].to_numpy())
+            return raw_df[changed], set(hashes.index[changed]), hashes
+        hashes = _row_hashes(raw_df)
+        new = ~hashes.isin(self.seen_hashes[name]).to_numpy()
+        return raw_df[new], set(), hashes[new]
+
+    def _remember(self, name, hashes):
+        """
+        Marks raw rows as transformed
+        :param name: dataset name
+        :param hashes: hashes from _new_rows
+        :return: None
+        """
+        if name == 'orders':
+            self.order_hashes = hashes
+        else:
+            self.seen_hashes[name].update(hashes)
+
+    def _merge(self, name, transformed, replaced_ids):
+        """
+        Merges transformed rows into the running frame: orders - last version of every id,
+        pins - plain append, unformed - append and dedup by UNFORMED_DUPLICATES over the whole day
+        :param name: dataset name
+        :param transformed: transformed new rows
+        :param replaced_ids: raw order ids whose previous versions must be dropped
+        :return: None
+        """
+        running = self.frames.get(name)
+        if running is None:
+            merged = transformed.reset_index(drop=True)
+        elif name == 'orders':
+            key = df_t.natural_key(name, running)
+            if replaced_ids:  # old versions go away even if the new version was filtered out by the transform
+                running = running[~running[key].astype(str).isin(replaced_ids)]
+            merged = pd.concat([running, transformed], ignore_index=True)
+            merged = merged.drop_duplicates(subset=key, keep='last', ignore_index=True)
+        else:
+            merged = pd.concat([running, transformed], ignore_index=True)
+        if name == 'unformed':  # duplicates may come in different polls
+            merged = merged.drop_duplicates(subset=df_t.unformed_duplicates_subset(), ignore_index=True)
+        self.frames[name] = merged
+
+    def poll(self, **save_options):
+        """
+        Loads fresh data of the day, transforms new rows and rewrites the running day files
+        :param save_options: output options for df_t.save_dataframe
+        :return: dict {dataset name: number of transformed rows}
+        """
+        logger = logging.getLogger(__name__)
+        decoded = decode_date(fetch_date(self.date, datasets=self.datasets))
+        counts = {}
+        for name, type_query, suffix in DATASETS:
+            if name not in decoded['datasets']:
+                continue
+            new_rows, replaced_ids, hashes = self._new_rows(name, decoded[name])
+            counts[name] = len(new_rows)
+            if new_rows.empty:
+                self._remember(name, hashes)
+                continue
+            transformed = df_t.transform_dataset(name, new_rows.reset_index(drop=True),
+                                                 dims=decoded['dims'],
+                                                 geo_df=decoded['geo_df'],
+                                                 options_df=decoded['options_df'],
+                                                 date=self.date,
+                                                 zone_cache=decoded['zone_cache'])
+            self._merge(name, transformed, replaced_ids)
+            self._remember(name, hashes)
+            df_t.save_dataframe(self.frames[name], date=self.date, suffix=suffix, **save_options)
+        decoded['zone_cache'].save()
+        logger.info(f'Incremental poll of {self.date}: transformed rows {counts}, {decoded["zone_cache"].stats()}')
+        print(f'{self.date}: transformed rows {counts}')
+        return counts
+
+
+def run_incremental(every_minutes, datasets=None, **save_options):
+    """
+    Polls the current day forever. State is reset when the day changes
+    :param every_minutes: minutes between polls
+    :param datasets: names of datasets to load, all by default
+    :param save_options: output options for df_t.save_dataframe
+    :return: None
+    """
+    logger = logging.getLogger(__name__)
+    day = None
+    while True:
+        today = dt_date.today().strftime("%Y-%m-%d")
+        if day is None or day.date != today:
+            day = IncrementalDay(today, datasets=datasets)
+        try:
+            day.poll(**save_options)
+        except Exception as e:  # rows are remembered only after merge, so the next poll retries them
+            logger.error(f'Incremental poll of {today} failed: {e!r}')
+            print('Error:', e)
+        sleep(every_minutes * 60)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(filename='TK_incremental.log',
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        filemode='a',
+                        level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Intraday incremental load of the current day')
+    parser.add_argument('--every', type=float, default=15, help='minutes between polls')
+    parser.add_argument('--only', default=None, metavar='DATASETS',
+                        help=f'comma separated datasets to load: {",".join(DATASET_NAMES)} (default - all)')
+    parser.add_argument('--output-dir', default=None, help='folder for files (default - month folder on bigshare)')
+    args = parser.parse_args()
+    run_incremental(args.every,
+                    datasets=args.only.split(',') if args.only else None,
+                    output_dir=args.output_dir)
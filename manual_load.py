@@ -1,37 +1,84 @@
+import argparse
 import logging
 from datetime import datetime
+from functools import partial
 
 import pandas as pd
-from playsound import playsound
 
 import TK_utils as tk_u
+import compressed_csv
 import dataframe_transformations as df_t
+import monthly_rollup
+from dimensions import DimensionRegistry
+from pipeline import run_pipeline
+from progress import LoadCancelled, progress
+import shadow
 import renaming_dicts
 import secrets
+import zone_cache as z_c
 
 """
 manual_load.py contains load_one_date function, which do what it says.
-This module can be executed for manual load one date or date interval.
+This module can be executed for manual load one date or date interval
+(interactively or with command line arguments, see 'python manual_load.py --help').
 It also can be imported for scheduling load
 """
 
 
-def load_one_date(date):
-    """Loads only ine particular date onto hard drive (and Google Drive - now disabled).
-    \nInputs: selected date in "YYYY-MM-DD" format
-    \nOutputs: Nothing"""
-    # Pins and unformed, car classes, cities_ids
+DATASETS = [  # (dataset name, API type_query, filename suffix)
+    ('unformed', 'get_qlick_leads', 'неоф'),  # it's name mistake, in fact it loads only unformed orders
+    ('pins', 'get_qlick_pins', 'пины'),
+    ('orders', 'get_qlick_orders', 'заказы'),
+]
+DATASET_NAMES = [name for name, _, _ in DATASETS]
+
+
+def fetch_date(date, datasets=None):
+    """
+    Pipeline stage 1: requests server for all the data of the date
+    :param date: date in "YYYY-MM-DD" format
+    :param datasets: names of datasets to load (see DATASETS), all by default.
+    Unformed orders are requested anyway - car classes, cities and options come with them
+    :return: dict with date, selected datasets and server responds by dataset name (plus 'geo')
+    """
     logger = logging.getLogger(__name__)
     logger.info(f'...loading "{date}"')
     print(f'...loading "{date}"')
-    unf_params = {
-        'type_query': 'get_qlick_leads',  # it's name mistake, in fact it loads only unformed orders
+    datasets = DATASET_NAMES if datasets is None else datasets
+    fetched = {'date': date, 'datasets': [name for name in DATASET_NAMES if name in datasets]}
+    for name, type_query, _ in DATASETS:
+        if name not in datasets and name != 'unformed':
+            continue
+        params = {
+            'type_query': type_query,
+            'name': secrets.login,
+            'pass': secrets.password,
+            'date': date,
+            'lang': 'ru'
+        }
+        fetched[name] = tk_u.server_request(secrets.api_url_tail, params)
+    # Geozones
+    geo_params = {
+        'type_query': 'get_qlick_geo_zones',
         'name': secrets.login,
         'pass': secrets.password,
-        'date': date,
         'lang': 'ru'
     }
-    unformed_content = tk_u.server_request(secrets.api_url_tail, unf_params)
+    fetched['geo'] = tk_u.server_request(secrets.api_url_tail, geo_params)
+    return fetched
+
+
+def decode_date(fetched):
+    """
+    Pipeline stage 2: decodes server responds into DataFrames and builds lookup tables
+    :param fetched: result of fetch_date
+    :return: dict with date, dims, options_df, geo_df, zone_cache and raw DataFrames of selected datasets
+    by dataset name
+    """
+    logger = logging.getLogger(__name__)
+    date = fetched['date']
+    # Car classes, cities_ids and options come with unformed orders
+    unformed_content = fetched['unformed']
 
     # Car classes
     car_classes_df = pd.DataFrame(unformed_content['car_classes'])  # 'car classes' in JSON table
@@ -52,6 +99,9 @@ def load_one_date(date):
     except PermissionError:
         logger.warning(f'Cities ids file is locked by another user. Rewriting failed.')
 
+    # Id-indexed lookups for car classes and cities, shared by all transforms of the date
+    dims = DimensionRegistry(car_classes_df=car_classes_df, cities_df=cities_df)
+
     # Options for orders
     options_df = pd.DataFrame(unformed_content['options'])
     options_df = options_df[options_df.id_option < 94]
@@ -60,59 +110,185 @@ def load_one_date(date):
     # options_df.to_csv(r"match_tables/options.csv", sep=';', index=False)
 
     # Geozones
-    geo_params = {
-        'type_query': 'get_qlick_geo_zones',
-        'name': secrets.login,
-        'pass': secrets.password,
-        'lang': 'ru'
-    }
-    geo_content = tk_u.server_request(secrets.api_url_tail, geo_params)
-    geo_json = tk_u.decode_decompress(geo_content['data'])
+    geo_json = tk_u.decode_decompress(fetched['geo']['data'])
     geo_df = df_t.get_geozones(pd.DataFrame(geo_json), cities_df=cities_df)
 
-    # Unformed orders
-    unformed_json = tk_u.decode_decompress(unformed_content['data'], backup_name='unf', date=date)
-    df_t.modify_and_save_unformed(pd.DataFrame(unformed_json),
-                                  car_classes_df=car_classes_df,
-                                  cities_df=cities_df,
-                                  geo_df=geo_df,
-                                  date=date)
-    logger.info(f'{unf_params["type_query"]} has loaded ')
-
-    # Pins
-    pin_params = {
-        'type_query': 'get_qlick_pins',
-        'name': secrets.login,
-        'pass': secrets.password,
-        'date': date,
-        'lang': 'ru'
-    }
-    pin_content = tk_u.server_request(secrets.api_url_tail, pin_params)
-    pin_json = tk_u.decode_decompress(pin_content['data'], backup_name='pins', date=date)
-    df_t.modify_and_save_pins(pd.DataFrame(pin_json),
-                              car_classes_df=car_classes_df,
-                              cities_df=cities_df,
-                              geo_df=geo_df,
-                              date=date)
-    logger.info(f'{pin_params["type_query"]} has loaded ')
-
-    # Orders
-    ord_params = {
-        'type_query': 'get_qlick_orders',
-        'name': secrets.login,
-        'pass': secrets.password,
-        'date': date,
-        'lang': 'ru'
-    }
-    ord_content = tk_u.server_request(secrets.api_url_tail, ord_params)
-    ord_json = tk_u.decode_decompress(ord_content['data'], backup_name='orders', date=date)
-    df_t.modify_and_save_orders(pd.DataFrame(ord_json),
-                                car_classes_df=car_classes_df,
-                                cities_df=cities_df,
-                                options_df=options_df,
-                                geo_df=geo_df,
-                                date=date)
-    logger.info(f'{ord_params["type_query"]} has loaded')
+    # Zone cache is shared by all dates and lives between runs; cleared if geozones have changed
+    zone_cache = z_c.shared_cache(z_c.payload_hash(fetched['geo']['data']))
+
+    decoded = {'date': date, 'datasets': fetched['datasets'], 'dims': dims, 'options_df': options_df,
+               'geo_df': geo_df, 'zone_cache': zone_cache}
+    for name in fetched['datasets']:
+        decoded[name] = pd.DataFrame(tk_u.decode_decompress(fetched[name]['data'], backup_name=name, date=date))
+    return decoded
+
+
+def transform_date(decoded, compute_engine='pandas'):
+    """
+    Pipeline stage 3: transforms raw DataFrames of the date (without saving)
+    :param decoded: result of decode_date
+    :param compute_engine: 'pandas' or 'arrow' (see df_t.COMPUTE_ENGINES)
+    :return: dict with date, selected datasets and transformed DataFrames by dataset name
+    """
+    logger = logging.getLogger(__name__)
+    date = decoded['date']
+    transformed = {'date': date, 'datasets': decoded['datasets']}
+    for name in decoded['datasets']:
+        transformed[name] = df_t.transform_dataset(name, decoded[name],
+                                                   dims=decoded['dims'],
+                                                   geo_df=decoded['geo_df'],
+                                                   options_df=decoded['options_df'],
+                                                   date=date,
+                                                   compute_engine=compute_engine,
+                                                   zone_cache=decoded['zone_cache'])
+    decoded['zone_cache'].save()
+    logger.info(f'{date}: {decoded["zone_cache"].stats()}')
+    return transformed
+
+
+def write_date(transformed, rollup=True, rollup_format=monthly_rollup.DEFAULT_FORMAT, **save_options):
+    """
+    Pipeline stage 4: saves transformed DataFrames of the date and updates monthly stores
+    :param transformed: result of transform_date
+    :param rollup: update monthly stores and aggregates (see monthly_rollup.py) in the same folder.
+    Errors of the update are logged only, re-load the date to put it into the monthly store
+    :param rollup_format: format of monthly stores, one of monthly_rollup.ROLLUP_FORMATS
+    :param save_options: output options for df_t.save_dataframe (output_dir, fmt, compression, compression_level).
+    By default - csv in month folder on bigshare
+    :return: None
+    """
+    logger = logging.getLogger(__name__)
+    date = transformed['date']
+    for name, type_query, suffix in DATASETS:
+        if name not in transformed['datasets']:
+            continue
+        df_t.save_dataframe(transformed[name], date=date, suffix=suffix, **save_options)
+        if rollup:  # daily file is already written, so a failed monthly update doesn't fail the date
+            try:
+                monthly_rollup.update_month(name, suffix, transformed[name], date=date,
+                                            output_dir=save_options.get('output_dir'), fmt=rollup_format)
+            except PermissionError:
+                logger.warning(f'Monthly {suffix} file is locked by another user. {date} is not in the monthly store.')
+            except Exception as e:
+                logger.error(f'Monthly {suffix} update for {date} failed: {e!r}')
+        logger.info(f'{type_query} has loaded')
+
+
+def load_stages(datasets=None, compute_engine='pandas', shadow_engine=None, shadow_report_dir=None, **save_options):
+    """
+    :param datasets: names of datasets to load, all by default
+    :param compute_engine: 'pandas' or 'arrow' (see df_t.COMPUTE_ENGINES)
+    :param shadow_engine: candidate transform engine to run in shadow mode (see shadow.py), None - no shadow run
+    :param shadow_report_dir: folder for mismatching cells of shadow run
+    :param save_options: output options for df_t.save_dataframe
+    :return: list of (stage name, function) for run_pipeline. Stages are tracked by progress.progress
+    """
+    if shadow_engine is None:
+        transform = partial(transform_date, compute_engine=compute_engine)
+    else:
+        transform = partial(shadow.shadow_transform, candidate=shadow_engine, report_dir=shadow_report_dir,
+                            compute_engine=compute_engine)
+    stages = [('fetch', partial(fetch_date, datasets=datasets)),
+              ('decode', decode_date),
+              ('transform', transform),
+              ('write', partial(write_date, **save_options))]
+    return [(name, progress.track(name, func, last_stage=(name == 'write'))) for name, func in stages]
+
+
+def _tracked_run(dates, run):
+    """
+    Runs the load with start/finish marks in progress.progress
+    :param dates: list of dates of the run
+    :param run: function without arguments, which does the load
+    :return: None
+    """
+    progress.start_run(dates)
+    try:
+        run()
+    except Exception as e:
+        cancelled = isinstance(e, LoadCancelled) or isinstance(getattr(e, 'error', None), LoadCancelled)
+        progress.finish_run('cancelled' if cancelled else f'failed: {e}')
+        raise
+    progress.finish_run('ok')
+
+
+def load_one_date(date, datasets=None, **options):
+    """Loads only ine particular date onto hard drive (and Google Drive - now disabled).
+    \nInputs: selected date in "YYYY-MM-DD" format; names of datasets to load (all by default),
+    shadow mode and output options (see load_stages)
+    \nOutputs: Nothing"""
+    def run():
+        result = date
+        for _, stage in load_stages(datasets=datasets, **options):
+            result = stage(result)
+
+    _tracked_run([date], run)
+
+
+def load_date_range(dates, depth=1, datasets=None, **options):
+    """
+    Loads dates interval. Fetch, decode, transform and write stages work in parallel threads,
+    so consecutive dates overlap and the whole load goes at the speed of the slowest stage.
+    :param dates: list of dates in "YYYY-MM-DD" format
+    :param depth: how many dates may wait between two stages (more - faster on uneven stages, but more memory)
+    :param datasets: names of datasets to load, all by default
+    :param options: shadow mode and output options (see load_stages)
+    :return: None. Raises pipeline.PipelineError if some date failed or the load was stopped
+    (dates before the failed one are still written, its unfinished attribute lists dates to reload)
+    """
+    _tracked_run(dates, lambda: run_pipeline(dates, load_stages(datasets=datasets, **options), depth=depth))
+
+
+def parse_args(argv=None):
+    """
+    Command line interface. Without date arguments the load is interactive, as before
+    :param argv: list of arguments, sys.argv by default
+    :return: argparse.Namespace
+    """
+    def date_arg(value):
+        datetime.strptime(value, '%Y-%m-%d')  # raises ValueError => argparse prints an error
+        return value
+
+    def datasets_arg(value):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(names) - set(DATASET_NAMES)
+        if unknown or not names:
+            raise argparse.ArgumentTypeError(f'choose from {", ".join(DATASET_NAMES)}')
+        return names
+
+    parser = argparse.ArgumentParser(description='Manual load of one date or dates interval')
+    dates = parser.add_mutually_exclusive_group()
+    dates.add_argument('--date', type=date_arg, help='date to load, YYYY-MM-DD')
+    dates.add_argument('--yesterday', action='store_true', help='load yesterday')
+    dates.add_argument('--start', type=date_arg, help='first date of interval, YYYY-MM-DD (requires --end)')
+    parser.add_argument('--end', type=date_arg, help='last date of interval (included), YYYY-MM-DD')
+    parser.add_argument('--only', type=datasets_arg, default=None, metavar='DATASETS',
+                        help=f'comma separated datasets to load: {",".join(DATASET_NAMES)} (default - all)')
+    parser.add_argument('--output-dir', default=None, help='folder for files (default - month folder on bigshare)')
+    parser.add_argument('--format', dest='fmt', choices=list(df_t.SAVE_FORMATS), default='csv', help='file format')
+    parser.add_argument('--compress', dest='compression', choices=list(compressed_csv.COMPRESSIONS), default=None,
+                        help='compress csv files (adds .gz/.zst to the filename)')
+    parser.add_argument('--compress-level', dest='compression_level', type=int, default=None,
+                        help='compression level (default: gzip 6, zstd 3)')
+    parser.add_argument('--no-rollup', dest='rollup', action='store_false',
+                        help="don't update monthly stores and aggregates")
+    parser.add_argument('--rollup-format', choices=list(monthly_rollup.ROLLUP_FORMATS),
+                        default=monthly_rollup.DEFAULT_FORMAT, help='format of monthly stores (parquet needs pyarrow)')
+    parser.add_argument('--compute-engine', choices=df_t.COMPUTE_ENGINES, default='pandas',
+                        help='engine for empty strings replacement in transforms (arrow needs pyarrow)')
+    parser.add_argument('--shadow', dest='shadow_engine', type=shadow.load_engine, default=None,
+                        metavar='MODULE:ENGINE',
+                        help='run candidate transform engine in shadow mode and compare it with the current one')
+    parser.add_argument('--shadow-report-dir', default=None, help='folder for mismatching cells of shadow run')
+    parser.add_argument('--depth', type=int, default=1, help='pipeline queue depth for intervals')
+    args = parser.parse_args(argv)
+    if (args.start is None) != (args.end is None):
+        parser.error('--start and --end go together')
+    if args.start is not None and args.start > args.end:
+        parser.error('--start must not be later than --end')
+    if args.compression is not None and args.fmt != 'csv':
+        parser.error('--compress works only with csv format')
+    return args
 
 
 if __name__ == '__main__':
@@ -122,19 +298,30 @@ if __name__ == '__main__':
                         level=logging.INFO)
     logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
     logger = logging.getLogger(__name__)
-    print('Hello there!\nTo load one date press Enter.\nTo load an interval enter anything: ', end='')
-    select = input()
-    if select:
-        date_range = tk_u.set_interval()
-        load_start_timestamp = datetime.now()
-        for date in date_range:
-            load_one_date(date)
+    args = parse_args()
+    options = {'datasets': args.only, 'compute_engine': args.compute_engine,
+               'output_dir': args.output_dir, 'fmt': args.fmt, 'rollup': args.rollup,
+               'rollup_format': args.rollup_format,
+               'compression': args.compression, 'compression_level': args.compression_level,
+               'shadow_engine': args.shadow_engine, 'shadow_report_dir': args.shadow_report_dir}
+    if args.start is not None:
+        date_range = tk_u.date_range(args.start, args.end)
+    elif args.date is not None or args.yesterday:
+        date_range = [args.date or tk_u.yesterday()]
+    else:  # interactive mode
+        print('Hello there!\nTo load one date press Enter.\nTo load an interval enter anything: ', end='')
+        select = input()
+        date_range = tk_u.set_interval() if select else [tk_u.set_date()]
+    load_start_timestamp = datetime.now()
+    if len(date_range) > 1:
+        load_date_range(date_range, depth=args.depth, **options)
     else:
-        date = tk_u.set_date()
-        load_start_timestamp = datetime.now()
-        load_one_date(date)
+        load_one_date(date_range[0], **options)
     tk_u.manual_logging_timedelta(load_start_timestamp)
     try:
+        from playsound import playsound  # imported here, it's needed only at the very end of manual load
         playsound('./data/Duck_is_burning.wav')
+    except ImportError:
+        logger.warning("Playsound isn't installed, no sound this time")
     except UnicodeDecodeError:
         logger.error("Damn, Playsound isn't working again")
@@ -0,0 +1,124 @@
+"""
+monthly_rollup.py keeps incrementally updated monthly stores: one file per dataset and month
+next to the daily files, updated by every loaded day. Rows of the day are stored as a partition
+(the 'load_date' column), so re-loading a day replaces its partition and the update is idempotent.
+For orders there is also a monthly aggregate: orders count, revenue and partner share
+by day x city x pickup zone x hour x status.
+"""
+import os
+
+import pandas as pd
+
+import TK_utils as tk_u
+import renaming_dicts
+
+PARTITION_COLUMN = 'load_date'
+ROLLUP_FORMATS = {  # format name: (file extension, writer(df, path), reader(path))
+    'pickle': ('pkl', lambda df, path: df.to_pickle(path), pd.read_pickle),
+    'parquet': ('parquet', lambda df, path: _to_parquet(df, path), pd.read_parquet),  # needs pyarrow
+}
+DEFAULT_FORMAT = 'parquet'  # compressed and readable without Python; pickle is for machines without pyarrow
+# Orders aggregate: source columns (names before renaming_dicts.orders) and measures
+AGG_DIMENSIONS = ['city', 'Название зоны подачи', 'status']
+AGG_MEASURES = {  # measure name: source columns to sum
+    'revenue': ['c_auto', 'c_auto_b'],
+    'partner_share': ['Часть_партнера'],
+}
+
+
+def _column(name):
+    """
+    :param name: orders column name before final renaming
+    :return: its name in the saved orders file
+    """
+    return renaming_dicts.orders.get(name, name)
+
+
+def _to_parquet(df, path):
+    """
+    Writes parquet file. Mixed object columns (strings with numbers, for example) are stored as strings,
+    as they are in csv files - parquet column must have one type
+    :param df: Pandas DataFrame
+    :param path: file path
+    :return: None
+    """
+    mixed = [column for column in df.columns
+             if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True).startswith('mixed')]
+    df = df.assign(**{column: df[column].where(df[column].isna(), df[column].astype(str)) for column in mixed})
+    df.to_parquet(path, index=False)
+
+
+def rollup_path(date, suffix, output_dir=None, fmt=DEFAULT_FORMAT):
+    """
+    :param date: any date of the month in "YYYY-MM-DD" format
+    :param suffix: dataset name in the filename ('пины', 'неоф', 'заказы' or 'заказы_агрегат')
+    :param output_dir: folder of the monthly store, by default - month folder on bigshare
+    :param fmt: one of ROLLUP_FORMATS
+    :return: path of the monthly file, like '.../2021-03_заказы_месяц.parquet'
+    """
+    folder = tk_u.set_bigshare_dir(date) if output_dir is None else output_dir
+    return f"{folder}/{date[:7]}_{suffix}_месяц.{ROLLUP_FORMATS[fmt][0]}"
+
+
+def _replace_partition(path, df, date, fmt):
+    """
+    Replaces rows of the date in the monthly file with df (creates the file if needed)
+    :param path: monthly file path
+    :param df: rows of the date
+    :param date: date in "YYYY-MM-DD" format
+    :param fmt: one of ROLLUP_FORMATS
+    :return: None
+    """
+    _, writer, reader = ROLLUP_FORMATS[fmt]
+    df = df.assign(**{PARTITION_COLUMN: date})
+    if os.path.isfile(path):
+        month = reader(path)
+        month = month[month[PARTITION_COLUMN] != date]
+        df = pd.concat([month, df], ignore_index=True).sort_values(PARTITION_COLUMN, kind='stable',
+                                                                   ignore_index=True)
+    tmp_path = path + '.tmp'
+    writer(df, tmp_path)
+    os.replace(tmp_path, path)  # readers never see half-written file
+
+
+def aggregate_orders(df):
+    """
+    Orders count, revenue and partner share by city x pickup zone x hour x status
+    :param df: transformed orders (as saved to file)
+    :return: Pandas DataFrame with the aggregate
+    """
+    dims = [_column(name) for name in AGG_DIMENSIONS]
+    hours = pd.to_datetime(df[_column('Дата и время подачи')], format='%d.%m.%Y %H:%M').dt.hour.rename('hour')
+    measures = pd.DataFrame({'orders': 1}, index=df.index)
+    for measure, columns in AGG_MEASURES.items():
+        measures[measure] = sum(pd.to_numeric(df[_column(column)], errors='coerce').fillna(0) for column in columns)
+    keys = [df[column] for column in dims] + [hours]
+    return measures.groupby(keys, dropna=False).sum().reset_index()
+
+
+def update_month(name, suffix, df, date, output_dir=None, fmt=DEFAULT_FORMAT):
+    """
+    Puts loaded day into the monthly store of the dataset (and into the orders aggregate)
+    :param name: dataset name - 'unformed', 'pins' or 'orders'
+    :param suffix: dataset name in the filename ('пины', 'неоф' or 'заказы')
+    :param df: transformed Pandas DataFrame of the day
+    :param date: date in "YYYY-MM-DD" format
+    :param output_dir: folder of the monthly store, by default - month folder on bigshare
+    :param fmt: one of ROLLUP_FORMATS
+    :return: None
+    """
+    _replace_partition(rollup_path(date, suffix, output_dir, fmt), df, date, fmt)
+    if name == 'orders':
+        _replace_partition(rollup_path(date, 'заказы_агрегат', output_dir, fmt), aggregate_orders(df), date, fmt)
+
+
+def read_month(suffix, date, output_dir=None, fmt=DEFAULT_FORMAT):
+    """
+    Reads monthly store
+    :param suffix: 'пины', 'неоф', 'заказы' or 'заказы_агрегат'
+    :param date: any date of the month in "YYYY-MM-DD" format
+    :param output_dir: folder of the monthly store, by default - month folder on bigshare
+    :param fmt: one of ROLLUP_FORMATS
+    :return: Pandas DataFrame
+    """
+    return ROLLUP_FORMATS[fmt][2](rollup_path(date, suffix, output_dir, fmt))
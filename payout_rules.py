@@ -0,0 +1,224 @@
+"""
+payout_rules.py contains driver payout (p_driver_s) and partner share (Часть_партнера) rules for orders.
+Rules are written as a declarative table and evaluated over integer-coded columns with shared masks.
+It also contains golden-output harness: the previous implementation kept as reference and a comparison
+of both on real or synthetic orders. Run it as a script for the check:
+    python payout_rules.py [orders.pkl]
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Payment type codes, when the driver gets the money directly ('Наличный', 'Залог', ...)
+CASH_PAYMENT_CODES = [0, 2, 12]
+CARD_TO_DRIVER_CODE = 5  # 'Картой вод' - counts as cash only if driver has personal terminal (10th bit of WARN)
+CANCELLED_STATUS_CODE = 3
+
+# Rule = (target column, mask name or None for all rows, action, operands).
+# Actions: 'set' - sum of operands, 'add' - add sum of operands, 'max' - elementwise maximum with operand,
+# 'perc' - multiply by operand percent and round. Operand is a column name ('-' prefix negates it) or a number.
+# Rules are applied from top to bottom, so every rule sees the results of the previous ones.
+PAYOUT_RULES = [
+    # Driver's part. Tips (5%, 10% and 15%) included. We can't count them separately without API improvement
+    # 1.1 Private drivers and our drivers with car in 'раскат' get order's and paid waiting's cost
+    # if order was paid in cash
+    ('p_driver_s', 'driver_takes_cash', 'add', ('c_auto', 'pp_sum')),
+    # 1.2 ...and paid services's cost if it was paid in cash (payment type 2)
+    ('p_driver_s', 'driver_takes_cash_b', 'add', ('c_auto_b',)),
+    # 2. Cashless payment: paid services's cost is subtracted
+    ('p_driver_s', 'cashless', 'add', ('-p_auto',)),
+    # Part of the driver is 0 for cancelled orders
+    ('p_driver_s', 'cancelled', 'set', (0,)),
+    # Partner's part
+    ('Часть_партнера', None, 'set', ('c_auto', 'c_auto_b', '-oper_pay')),
+    ('Часть_партнера', 'fixed_partner_part', 'set', ('c_auto_2',)),
+    ('Часть_партнера', None, 'max', ('dr_minimum',)),
+    ('Часть_партнера', None, 'add', ('pp_sum',)),
+    ('Часть_партнера', None, 'perc', ('franch_perc',)),
+]
+
+
+def code_column(series, missing=-1):
+    """
+    Casts string-coded column (like type_money or status) to integer codes
+    :param series: Pandas Series with codes as strings
+    :param missing: code for empty and non-numeric values
+    :return: numpy int64 array
+    """
+    return pd.to_numeric(series, errors='coerce').fillna(missing).to_numpy(dtype='int64')
+
+
+def build_masks(df):
+    """
+    Precomputes all masks used in PAYOUT_RULES. Every string comparison is done once, on integer codes
+    :param df: Pandas DataFrame with orders (warn and dr_opt are already unfolded to bools)
+    :return: dict {mask name: boolean numpy array}
+    """
+    type_money = code_column(df.type_money)
+    type_money_b = code_column(df.type_money_b)
+    warn = df.warn.to_numpy(dtype=bool)
+    # Private drivers and our drivers with car in 'раскат' [1st bit of DR_OPT is set]
+    driver_collects = (code_column(df.our_driver) != 0) | df.dr_opt.to_numpy(dtype=bool)
+    # 'Наличный' OR 'Залог' OR ('Картой вод' AND driver has personal terminal)
+    paid_cash = np.isin(type_money, CASH_PAYMENT_CODES) | ((type_money == CARD_TO_DRIVER_CODE) & warn)
+    paid_cash_b = np.isin(type_money_b, CASH_PAYMENT_CODES) | ((type_money_b == CARD_TO_DRIVER_CODE) & warn)
+    return {
+        'driver_takes_cash': driver_collects & paid_cash,
+        'driver_takes_cash_b': driver_collects & paid_cash_b,
+        'cashless': ~paid_cash,
+        'cancelled': code_column(df.status) == CANCELLED_STATUS_CODE,
+        'fixed_partner_part': df.c_auto_2.to_numpy() != -1,
+    }
+
+
+def _operand_value(df, operand):
+    """
+    :param df: Pandas DataFrame with orders
+    :param operand: column name (optionally with '-' prefix) or a number
+    :return: numpy array or number
+    """
+    if not isinstance(operand, str):
+        return operand
+    if operand.startswith('-'):
+        return -df[operand[1:]].to_numpy()
+    return df[operand].to_numpy()
+
+
+def evaluate_payout_rules(df, rules=None):
+    """
+    Evaluates payout rules over orders dataframe
+    :param df: Pandas DataFrame with orders
+    :param rules: rules table, PAYOUT_RULES by default
+    :return: dict {target column: numpy array with the result}
+    """
+    rules = PAYOUT_RULES if rules is None else rules
+    masks = build_masks(df)
+    results = {}
+    for target, mask_name, action, operands in rules:
+        if target in results:
+            current = results[target]
+        elif target in df.columns:
+            current = df[target].to_numpy()
+        else:  # new column
+            current = np.zeros(len(df), dtype='int64')
+        value = sum(_operand_value(df, operand) for operand in operands)
+        if action == 'set':
+            new = np.broadcast_to(value, current.shape)
+        elif action == 'add':
+            new = current + value
+        elif action == 'max':
+            new = np.maximum(current, value)
+        elif action == 'perc':
+            new = np.round(current * value / 100)
+        else:
+            raise ValueError(f'Unknown rule action "{action}"')
+        results[target] = np.where(masks[mask_name], new, current) if mask_name is not None else np.array(new)
+    return results
+
+
+def apply_payout_rules(df):
+    """
+    Fills 'p_driver_s' and creates 'Часть_партнера' columns
+    :param df: Pandas DataFrame with orders
+    :return: None
+    """
+    for column, values in evaluate_payout_rules(df).items():
+        df[column] = values
+
+
+def legacy_payouts(df):
+    """
+    Previous implementation of the payout logic. Golden reference for the rules table, don't change it
+    :param df: Pandas DataFrame with orders
+    :return: dict {target column: numpy array with the result}
+    """
+    df = df.copy()
+    df['p_driver_s'] = np.where(
+        ((df.our_driver != '0') | ((df.our_driver == '0') & df.dr_opt)) &
+        ((df.type_money == '0') |
+         (df.type_money == '2') |
+         (df.type_money == '12') |
+         ((df.type_money == '5') & df.warn)),
+        df.p_driver_s + df.c_auto + df.pp_sum,
+        df.p_driver_s)
+    df['p_driver_s'] = np.where(
+        ((df.our_driver != '0') | ((df.our_driver == '0') & df.dr_opt)) &
+        ((df.type_money_b == '0') |
+         (df.type_money_b == '2') |
+         (df.type_money_b == '12') |
+         ((df.type_money_b == '5') & df.warn)),
+        df.p_driver_s + df.c_auto_b,
+        df.p_driver_s)
+    df['p_driver_s'] = np.where(
+        ((df.type_money != '0') &
+         (df.type_money != '2') &
+         (df.type_money != '12') &
+         np.logical_not((df.type_money == '5') & df.warn)),
+        df.p_driver_s - df.p_auto,
+        df.p_driver_s)
+    df['p_driver_s'] = np.where(df.status == '3', 0, df.p_driver_s)
+    df['Часть_партнера'] = df.c_auto + df.c_auto_b - df.oper_pay
+    df.loc[df.c_auto_2 != -1, 'Часть_партнера'] = df.c_auto_2
+    df.loc[df.dr_minimum > df['Часть_партнера'], 'Часть_партнера'] = df.dr_minimum
+    df['Часть_партнера'] = df['Часть_партнера'] + df.pp_sum
+    df['Часть_партнера'] = round((df['Часть_партнера'] * df.franch_perc) / 100)
+    return {'p_driver_s': df['p_driver_s'].to_numpy(), 'Часть_партнера': df['Часть_партнера'].to_numpy()}
+
+
+def synthetic_orders(n_rows=100000, seed=0):
+    """
+    Generates orders with random codes and sums, covering all combinations of payout conditions
+    :param n_rows: number of rows
+    :param seed: random seed
+    :return: Pandas DataFrame with columns used by payout rules
+    """
+    rng = np.random.RandomState(seed)
+    money_codes = np.array(['0', '1', '2', '3', '5', '12', '13', np.NaN], dtype=object)
+    return pd.DataFrame({
+        'our_driver': rng.choice(np.array(['0', '1', '2'], dtype=object), n_rows),
+        'dr_opt': rng.randint(0, 2, n_rows).astype(bool),
+        'warn': rng.randint(0, 2, n_rows).astype(bool),
+        'type_money': rng.choice(money_codes, n_rows),
+        'type_money_b': rng.choice(money_codes, n_rows),
+        'status': rng.choice(np.array(['1', '2', '3', '4'], dtype=object), n_rows),
+        'p_driver_s': rng.randint(0, 3000, n_rows),
+        'c_auto': rng.randint(0, 3000, n_rows),
+        'c_auto_b': rng.randint(0, 1000, n_rows),
+        'pp_sum': rng.randint(0, 300, n_rows),
+        'p_auto': rng.randint(0, 300, n_rows),
+        'oper_pay': rng.randint(0, 500, n_rows),
+        'c_auto_2': np.where(rng.randint(0, 2, n_rows) == 1, -1, rng.randint(0, 3000, n_rows)),
+        'dr_minimum': rng.randint(0, 2000, n_rows),
+        'franch_perc': rng.choice([0., 5., 7.5, 10., 12.5, 100.], n_rows),
+    })
+
+
+def compare_with_legacy(df):
+    """
+    Golden-output check: evaluates rules table and legacy implementation on the same orders
+    :param df: Pandas DataFrame with orders (state right before payout calculation)
+    :return: Pandas DataFrame with mismatching rows (empty if both implementations agree)
+    """
+    expected = legacy_payouts(df)
+    actual = evaluate_payout_rules(df)
+    mismatch = np.zeros(len(df), dtype=bool)
+    for column in expected:
+        mismatch |= ~((expected[column] == actual[column]) |
+                      (pd.isna(expected[column]) & pd.isna(actual[column])))
+    report = df[mismatch].copy()
+    for column in expected:
+        report[column + '_legacy'] = expected[column][mismatch]
+        report[column + '_rules'] = actual[column][mismatch]
+    return report
+
+
+if __name__ == '__main__':
+    orders = pd.read_pickle(sys.argv[1]) if len(sys.argv) > 1 else synthetic_orders()
+    mismatches = compare_with_legacy(orders)
+    if mismatches.empty:
+        print(f'Payout rules match legacy implementation on {len(orders)} rows')
+    else:
+        print(f'{len(mismatches)} of {len(orders)} rows mismatch:')
+        print(mismatches.head(20).to_string())
+        sys.exit(1)
@@ -0,0 +1,100 @@
+"""
+pipeline.py contains run_pipeline - a small thread pipeline with bounded queues between stages.
+Every stage works in its own thread, so while one item is transformed the next one is already downloading.
+"""
+import logging
+import queue
+import threading
+
+_DONE = object()  # end-of-stream marker, goes through all the stages
+
+
+class PipelineError(RuntimeError):
+    """
+    Raised in the caller's thread when one of the stages failed.
+    item is the earliest failed item, unfinished - all the items that didn't pass the last stage
+    """
+
+    def __init__(self, stage, item, error, unfinished=()):
+        message = f'Stage "{stage}" failed on {item}: {error!r}'
+        if unfinished:
+            message += f'. Not finished: {", ".join(str(unfinished_item) for unfinished_item in unfinished)}'
+        super().__init__(message)
+        self.stage = stage
+        self.item = item
+        self.error = error
+        self.unfinished = list(unfinished)
+
+
+def run_pipeline(items, stages, depth=1):
+    """
+    Runs every item through the stages, consecutive items overlap in time.
+    Stops cleanly on the first error: new items are not started, items after the failed one are dropped,
+    and items before it still go through all the stages (so finished items never have gaps between them).
+    :param items: iterable with the inputs of the first stage (dates, for example)
+    :param stages: list of (stage name, function) pairs. The first function takes an item,
+    every next one takes the result of the previous one. The result of the last stage is thrown away
+    :param depth: max number of finished results waiting between two stages (caps the memory usage)
+    :return: None
+    """
+    logger = logging.getLogger(__name__)
+    items = list(items)
+    stop = threading.Event()  # interrupted by the caller - everything is dropped
+    lock = threading.Lock()
+    failed_at = []  # index of the earliest failed item (empty - no failures)
+    errors = []  # (item index, stage name, item, exception)
+    finished = set()  # indexes of items that passed the last stage
+    queues = [queue.Queue(maxsize=max(depth, 1)) for _ in stages]  # input queue of each stage
+
+    def dropped(index):
+        with lock:
+            return stop.is_set() or (failed_at and index > failed_at[0])
+
+    def feed():
+        for index, item in enumerate(items):
+            if stop.is_set() or failed_at:
+                break
+            queues[0].put((index, item, item))
+        queues[0].put(_DONE)
+
+    def work(n_stage, name, func):
+        while True:
+            message = queues[n_stage].get()
+            if message is _DONE:
+                if n_stage + 1 < len(stages):
+                    queues[n_stage + 1].put(_DONE)
+                break
+            index, item, payload = message
+            if dropped(index):  # keep draining the queue, so upstream stages never block on put
+                continue
+            try:
+                result = func(payload)
+            except Exception as e:
+                logger.error(f'Stage "{name}" failed on {item}: {e!r}')
+                with lock:
+                    errors.append((index, name, item, e))
+                    failed_at[:] = [min(failed_at + [index])]
+                continue
+            if n_stage + 1 < len(stages):
+                queues[n_stage + 1].put((index, item, result))
+            else:
+                with lock:
+                    finished.add(index)
+
+    threads = [threading.Thread(target=feed, name='pipeline-feed', daemon=True)]
+    for n_stage, (name, func) in enumerate(stages):
+        threads.append(threading.Thread(target=work, args=(n_stage, name, func),
+                                        name=f'pipeline-{name}', daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)  # short joins keep Ctrl+C working
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+    if errors:
+        _, name, item, error = min(errors, key=lambda error_info: error_info[0])
+        unfinished = [items[index] for index in range(len(items)) if index not in finished]
+        raise PipelineError(name, item, error, unfinished=unfinished)
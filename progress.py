@@ -0,0 +1,139 @@
+"""
+progress.py contains live telemetry of the loader: current date and stage, processed rows, throughput,
+elapsed time, ETA for intervals and per-stage timings of the last run.
+The loader updates the module-level 'progress' object, the telegram bot reads it (/status)
+and asks to cancel the run (/stop). Cancellation happens between stages.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+
+class LoadCancelled(RuntimeError):
+    """Raised by a stage wrapper when stop was requested"""
+
+
+def _rows(payload):
+    """
+    :param payload: stage input or output - dict with DataFrames by dataset name (or anything else)
+    :return: total rows of DataFrames of the payload datasets
+    """
+    if not isinstance(payload, dict):
+        return 0
+    return sum(len(payload[name]) for name in payload.get('datasets', [])
+               if isinstance(payload.get(name), pd.DataFrame))
+
+
+def _format_seconds(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+
+class LoadProgress:
+    """Thread-safe state of the current (or the last) load run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.running = False
+        self.dates = []
+        self.done_dates = []
+        self.current = {}  # stage name: date being processed now
+        self.rows = 0
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.stage_seconds = {}  # stage name: total seconds of the run
+
+    def start_run(self, dates):
+        """
+        :param dates: list of dates of the run
+        :return: None
+        """
+        with self._lock:
+            self._stop.clear()
+            self.running = True
+            self.dates = list(dates)
+            self.done_dates = []
+            self.current = {}
+            self.rows = 0
+            self.started = time.perf_counter()
+            self.finished = None
+            self.result = None
+            self.stage_seconds = {}
+
+    def finish_run(self, result):
+        """
+        :param result: text result of the run ('ok', 'failed', 'cancelled')
+        :return: None
+        """
+        with self._lock:
+            self.running = False
+            self.current = {}
+            self.finished = time.perf_counter()
+            self.result = result
+
+    def request_stop(self):
+        """
+        Asks the running load to stop before its next stage
+        :return: True if there is a run to stop
+        """
+        with self._lock:
+            if self.running:
+                self._stop.set()
+            return self.running
+
+    def track(self, stage, func, last_stage=False):
+        """
+        Wraps pipeline stage function: checks stop request and records stage timings and rows
+        :param stage: stage name
+        :param func: stage function
+        :param last_stage: if True - the date is counted as done after this stage
+        :return: wrapped function
+        """
+        def tracked(payload):
+            date = payload if isinstance(payload, str) else payload['date']
+            if self._stop.is_set():
+                raise LoadCancelled(f'Load was stopped before {stage} of {date}')
+            with self._lock:
+                self.current[stage] = date
+            start = time.perf_counter()
+            result = func(payload)
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.current.pop(stage, None)
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.) + seconds
+                if last_stage:
+                    self.rows += _rows(payload)
+                    self.done_dates.append(date)
+            return result
+        return tracked
+
+    def summary(self):
+        """
+        :return: text for /status
+        """
+        with self._lock:
+            if self.started is None:
+                return 'Выгрузок еще не было'
+            elapsed = (time.perf_counter() if self.running else self.finished) - self.started
+            lines = ['Выгрузка идет' if self.running else f'Последняя выгрузка: {self.result}']
+            if self.running:
+                for stage, date in self.current.items():
+                    lines.append(f'{date}: {stage}')
+                if self._stop.is_set():
+                    lines.append('Остановка запрошена')
+            lines.append(f'Даты: {len(self.done_dates)} из {len(self.dates)}')
+            lines.append(f'Строк: {self.rows} ({self.rows / elapsed if elapsed else 0:.0f} строк/сек)')
+            lines.append(f'Прошло: {_format_seconds(elapsed)}')
+            if self.running and self.done_dates and len(self.dates) > 1:
+                remaining = len(self.dates) - len(self.done_dates)
+                lines.append(f'Осталось примерно: {_format_seconds(elapsed / len(self.done_dates) * remaining)}')
+            if self.stage_seconds:
+                lines.append('Этапы: ' + ', '.join(f'{stage} {seconds:.1f} с'
+                                                   for stage, seconds in self.stage_seconds.items()))
+            return '\n'.join(lines)
+
+
+progress = LoadProgress()
@@ -2,44 +2,62 @@ import logging
 from datetime import date, timedelta
 from time import sleep
 
-import schedule
-from telegram.ext import CommandHandler
-from telegram.ext import Updater
-
 import bot_functions as b_f
 from manual_load import load_one_date
+from progress import LoadCancelled, progress
 from secrets import bot_token
 
-logging.basicConfig(filename='TK_automatized.log',
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    filemode='w',
-                    level=logging.INFO)
-logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
+updater = None  # telegram Updater, created by deploy_bot
+
 
-# bot stuff
-updater = Updater(token=bot_token, use_context=True)
-dispatcher = updater.dispatcher
-start_handler = CommandHandler('start', b_f.start)
-dispatcher.add_handler(start_handler)
-dispatcher.add_error_handler(b_f.error)
-updater.start_polling()
-logging.info("BOT DEPLOYED")
+def deploy_bot():
+    """
+    Starts telegram bot. Telegram library is imported here, so importing this module stays cheap
+    :return: telegram Updater
+    """
+    from telegram.ext import CommandHandler
+    from telegram.ext import Updater
+
+    bot_updater = Updater(token=bot_token, use_context=True)
+    dispatcher = bot_updater.dispatcher
+    start_handler = CommandHandler('start', b_f.start)
+    dispatcher.add_handler(start_handler)
+    dispatcher.add_handler(CommandHandler('help', b_f.helper))
+    dispatcher.add_handler(CommandHandler('status', b_f.status))
+    dispatcher.add_handler(CommandHandler('stop', b_f.stop))
+    dispatcher.add_error_handler(b_f.error)
+    bot_updater.start_polling()
+    logging.info("BOT DEPLOYED")
+    return bot_updater
 
 
 def job():
     yesterday = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
     try:
         load_one_date(yesterday)
+    except LoadCancelled:
+        updater.bot.send_message(chat_id='-479705730', text='Выгрузка остановлена')
+        print(f"{yesterday} loading stopped")
     except Exception as e:
         updater.bot.send_message(chat_id='-479705730', text=f'Скрипт упал с ошибкой {e}')
         print('Error:', e)
     else:
-        updater.bot.send_message(chat_id='-479705730', text='Выгрузки произведены')
+        updater.bot.send_message(chat_id='-479705730', text='Выгрузки произведены\n' + progress.summary())
         print(f"{yesterday} loading finished")
 
 
 if __name__ == '__main__':
+    import schedule
+
+    # log is configured only when the module is run, so importing it never truncates the production log
+    logging.basicConfig(filename='TK_automatized.log',
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        filemode='w',
+                        level=logging.INFO)
+    logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
     print('Ah shit, here we go again...')
+    # bot stuff
+    updater = deploy_bot()
     # Schedule a job
     schedule.every().day.at("08:30").do(job)
 
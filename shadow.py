@@ -0,0 +1,187 @@
+"""
+shadow.py runs a candidate transform engine side by side with the current one on the same decoded data.
+Files are always saved from the current engine's result, the candidate's result is only compared:
+cell by cell, NaN-aware, regardless of rows and columns order, with rows matched by natural keys.
+Timings of both engines are recorded, so the report shows the speedup per stage and all mismatching rows.
+Candidate engine is a dict {dataset name: transform function}, like dataframe_transformations.CURRENT_ENGINE.
+To try a faster helper (get_zone, extract_ride_options...) inside the current transforms use patched_engine.
+"""
+import argparse
+import importlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import dataframe_transformations as df_t
+
+@contextmanager
+def _patched(module, overrides):
+    """Temporarily replaces module attributes. Not thread-safe: shadow runs must not overlap"""
+    originals = {name: getattr(module, name) for name in overrides}
+    for name, func in overrides.items():
+        setattr(module, name, func)
+    try:
+        yield
+    finally:
+        for name, func in originals.items():
+            setattr(module, name, func)
+
+
+def patched_engine(**overrides):
+    """
+    Candidate engine = current transforms with some dataframe_transformations functions replaced
+    :param overrides: function name in dataframe_transformations = candidate function
+    (e.g. get_zone=fast_get_zone)
+    :return: engine dict {dataset name: transform function}
+    """
+    def wrap(transform):
+        def patched_transform(*args, **kwargs):
+            with _patched(df_t, overrides):
+                return transform(*args, **kwargs)
+        return patched_transform
+
+    return {name: wrap(transform) for name, transform in df_t.CURRENT_ENGINE.items()}
+
+
+def load_engine(path):
+    """
+    Imports candidate engine by its path
+    :param path: 'module:attribute', e.g. 'fast_transforms:ENGINE'
+    :return: engine dict. Raises argparse.ArgumentTypeError for wrong path, so it works as argparse type
+    """
+    module_name, _, attribute = path.partition(':')
+    try:
+        return getattr(importlib.import_module(module_name), attribute or 'ENGINE')
+    except (ImportError, AttributeError, ValueError) as e:  # ValueError - empty module name
+        raise argparse.ArgumentTypeError(f"can't load engine {path!r}: {e}")
+
+
+def _keyed(df, key):
+    """
+    Indexes dataframe by (key, n-th occurrence of the key) - so duplicated keys are matched too.
+    Rows with the same key are ordered by their content, so the original rows order doesn't matter
+    """
+    df = df.loc[df.astype(str).sort_values(list(df.columns)).index]
+    occurrence = df.groupby(key, dropna=False).cumcount()
+    return df.set_index([df[key].astype(str), occurrence.rename('_occurrence')])
+
+
+def _cells_equal(expected, actual):
+    """NaN-aware equality of two aligned Series; numbers are compared with float tolerance"""
+    both_na = expected.isna() & actual.isna()
+    if pd.api.types.is_numeric_dtype(expected) and pd.api.types.is_numeric_dtype(actual):
+        equal = np.isclose(expected.astype(float), actual.astype(float), rtol=1e-9, atol=1e-9)
+    else:
+        equal = (expected == actual).to_numpy(dtype=bool)
+    return equal | both_na.to_numpy()
+
+
+def compare_frames(expected, actual, key):
+    """
+    Compares two transformed dataframes
+    :param expected: result of the current engine
+    :param actual: result of the candidate engine
+    :param key: natural key column
+    :return: dict with missing/extra keys and columns and 'mismatches' DataFrame (key, column, expected, actual)
+    """
+    expected = _keyed(expected, key)
+    actual = _keyed(actual, key)
+    common_rows = expected.index.intersection(actual.index)
+    common_columns = [column for column in expected.columns if column in actual.columns]
+    mismatches = []
+    for column in common_columns:
+        exp = expected.loc[common_rows, column]
+        act = actual.loc[common_rows, column]
+        differ = ~_cells_equal(exp, act)
+        if differ.any():
+            mismatches.append(pd.DataFrame({'key': common_rows[differ].get_level_values(0),
+                                            'column': column,
+                                            'expected': exp[differ].to_numpy(),
+                                            'actual': act[differ].to_numpy()}))
+    return {
+        'missing_keys': list(expected.index.difference(actual.index).get_level_values(0)),
+        'extra_keys': list(actual.index.difference(expected.index).get_level_values(0)),
+        'missing_columns': [column for column in expected.columns if column not in actual.columns],
+        'extra_columns': [column for column in actual.columns if column not in expected.columns],
+        'mismatches': pd.concat(mismatches, ignore_index=True) if mismatches
+        else pd.DataFrame(columns=['key', 'column', 'expected', 'actual']),
+    }
+
+
+def _timed_transform(name, decoded, engine, compute_engine='pandas'):
+    start = time.perf_counter()
+    result = df_t.transform_dataset(name, decoded[name].copy(),  # transforms change input inplace
+                                    dims=decoded['dims'],
+                                    geo_df=decoded['geo_df'],
+                                    options_df=decoded['options_df'],
+                                    date=decoded['date'],
+                                    engine=engine,
+                                    compute_engine=compute_engine)
+    return result, time.perf_counter() - start
+
+
+def shadow_transform(decoded, candidate, report_dir=None, compute_engine='pandas'):
+    """
+    Pipeline stage: transforms date with current and candidate engines and compares the results
+    :param decoded: result of manual_load.decode_date
+    :param candidate: candidate engine dict
+    :param compute_engine: 'pandas' or 'arrow' (see df_t.COMPUTE_ENGINES), the same for both engines,
+    so differences come only from the candidate
+    :param report_dir: if set - mismatching cells are saved there (see save_mismatches)
+    :return: result of the current engine (like manual_load.transform_date) plus 'shadow_report'
+    """
+    logger = logging.getLogger(__name__)
+    date = decoded['date']
+    transformed = {'date': date, 'datasets': decoded['datasets'], 'shadow_report': {}}
+    for name in decoded['datasets']:
+        current, current_sec = _timed_transform(name, decoded, engine=None, compute_engine=compute_engine)
+        try:
+            shadow, shadow_sec = _timed_transform(name, decoded, engine=candidate, compute_engine=compute_engine)
+            report = compare_frames(current, shadow, key=df_t.natural_key(name, current))
+        except Exception as e:  # broken candidate must not break the load
+            logger.error(f'Shadow {name} for {date} failed: {e!r}')
+            report = {'error': repr(e), 'current_sec': current_sec}
+        else:
+            report.update(current_sec=current_sec, candidate_sec=shadow_sec,
+                          speedup=current_sec / shadow_sec if shadow_sec else np.inf)
+        transformed[name] = current
+        transformed['shadow_report'][name] = report
+        logger.info(f'Shadow {date}: {format_report(name, report)}')
+        print(f'Shadow {date}: {format_report(name, report)}')
+    if report_dir is not None:
+        save_mismatches(transformed, report_dir)
+    return transformed
+
+
+def format_report(name, report):
+    """
+    :param name: dataset name
+    :param report: report of one dataset from shadow_transform
+    :return: one-line summary
+    """
+    if 'error' in report:
+        return f'{name}: candidate failed with {report["error"]}'
+    summary = (f'{name}: current {report["current_sec"]:.2f} s, candidate {report["candidate_sec"]:.2f} s, '
+               f'speedup x{report["speedup"]:.2f}, {len(report["mismatches"])} mismatching cells')
+    for field in ['missing_keys', 'extra_keys', 'missing_columns', 'extra_columns']:
+        if report[field]:
+            summary += f', {len(report[field])} {field.replace("_", " ")}'
+    return summary
+
+
+def save_mismatches(transformed, report_dir):
+    """
+    Saves mismatching cells of every dataset to '{report_dir}/{date}_{dataset}_shadow.csv'
+    :param transformed: result of shadow_transform
+    :param report_dir: folder for reports
+    :return: None
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    for name, report in transformed['shadow_report'].items():
+        if 'mismatches' in report and not report['mismatches'].empty:
+            report['mismatches'].to_csv(f'{report_dir}/{transformed["date"]}_{name}_shadow.csv',
+                                        sep=';', index=False)
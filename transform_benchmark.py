@@ -0,0 +1,81 @@
+"""
+transform_benchmark.py times transforms of one date with every compute engine (pandas and arrow)
+and checks that their outputs are the same (see shadow.compare_frames).
+Data is requested and decoded once, then every transform runs on a fresh copy.
+Before that engines are compared on whitespace-only strings, which are easy to treat differently
+(RE2 and Python regex have different \s).
+Usage: python transform_benchmark.py YYYY-MM-DD [repeats, default 3]
+"""
+import sys
+import time
+
+import pandas as pd
+
+import dataframe_transformations as df_t
+import shadow
+from manual_load import decode_date, fetch_date
+
+WHITESPACE_CASES = ['', ' ', '\t', '\r\n', '\x0b', '\x0c', '\xa0', '\u2003', '\u202f', '\u3000', ' \xa0 ',
+                    'a', ' a ', 'a\xa0', '\xa0текст', None]
+
+
+def compare_whitespace():
+    """
+    Runs empty strings -> NaN step of every compute engine on WHITESPACE_CASES
+    :return: list of (value, compute engine) where the engine's result differs from the first engine
+    """
+    df = pd.DataFrame({'text': WHITESPACE_CASES})
+    results = {compute_engine: df_t._empty_to_nan(df, compute_engine)['text'].isna()
+               for compute_engine in df_t.COMPUTE_ENGINES}
+    reference = results[df_t.COMPUTE_ENGINES[0]]
+    return [(value, compute_engine)
+            for compute_engine in df_t.COMPUTE_ENGINES[1:]
+            for value, same in zip(WHITESPACE_CASES, reference == results[compute_engine]) if not same]
+
+
+def benchmark_date(date, repeats=3):
+    """
+    :param date: date in "YYYY-MM-DD" format
+    :param repeats: runs of every transform, the best time is taken
+    :return: dict {(dataset name, compute engine): best seconds}, dict {dataset name: comparison report}
+    """
+    decoded = decode_date(fetch_date(date))
+    timings = {}
+    reports = {}
+    for name in decoded['datasets']:
+        outputs = {}
+        for compute_engine in df_t.COMPUTE_ENGINES:
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                outputs[compute_engine] = df_t.transform_dataset(name, decoded[name].copy(),
+                                                                 dims=decoded['dims'],
+                                                                 geo_df=decoded['geo_df'],
+                                                                 options_df=decoded['options_df'],
+                                                                 date=date,
+                                                                 compute_engine=compute_engine)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            timings[(name, compute_engine)] = best
+        reference = outputs[df_t.COMPUTE_ENGINES[0]]
+        for compute_engine in df_t.COMPUTE_ENGINES[1:]:
+            reports[name] = shadow.compare_frames(reference, outputs[compute_engine],
+                                                  key=df_t.natural_key(name, reference))
+    return timings, reports
+
+
+if __name__ == '__main__':
+    bench_date = sys.argv[1]
+    bench_repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    for value, engine in compare_whitespace():
+        print(f'{engine}: empty strings -> NaN DIFFER on {value!r}')
+    bench_timings, bench_reports = benchmark_date(bench_date, repeats=bench_repeats)
+    for (dataset, engine), best_seconds in bench_timings.items():
+        print(f'{dataset:<10}{engine:<8}{best_seconds:>8.2f} s')
+    for dataset, report in bench_reports.items():
+        same = report['mismatches'].empty and not any(report[field] for field in
+                                                      ['missing_keys', 'extra_keys',
+                                                       'missing_columns', 'extra_columns'])
+        print(f'{dataset}: outputs {"are the same" if same else "DIFFER"}')
+        if not same:
+            print(report['mismatches'].head(20).to_string())
@@ -0,0 +1,155 @@
+"""
+zone_cache.py contains ZoneCache - persistent memo of get_zone polygon tests.
+Key is (city, x and y quantized to the API's 1e-6 precision), value is the zone name (or None - no zone found).
+One cache is shared by 'in' and 'out' passes and by pins, unformed and orders. It lives between runs
+in ZONE_CACHE_PATH and is size-bounded with LRU eviction. A cache object belongs to one geozones payload
+(geo_hash) and is never cleared: when geozones change, shared_cache gives a new empty cache, while transforms
+still running on the old geozones keep filling the old one, which isn't saved anymore.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+ZONE_CACHE_PATH = 'zone_cache.pkl'
+MAX_ENTRIES = 200000
+PRECISION = 10 ** 6  # coordinates come with 6 digits after the point
+MISSING = object()  # get() result for keys absent in the cache (None is a valid cached value)
+
+
+def payload_hash(data):
+    """
+    :param data: 'data' part of get_qlick_geo_zones respond (encoded string)
+    :return: hex digest, changes when any geozone changes
+    """
+    return hashlib.sha1(data.encode('UTF-8')).hexdigest()
+
+
+def zone_key(city, x, y):
+    """
+    :param city: city name of the row
+    :param x: x coordinate
+    :param y: y coordinate
+    :return: cache key
+    """
+    return city, int(round(float(x) * PRECISION)), int(round(float(y) * PRECISION))
+
+
+class ZoneCache:
+    """Thread-safe LRU cache {zone_key: zone name or None} of one geozones payload with hit/miss counters"""
+
+    def __init__(self, geo_hash, max_entries=MAX_ENTRIES, path=ZONE_CACHE_PATH):
+        self.geo_hash = geo_hash
+        self.retired = False  # geozones have changed, the cache isn't saved anymore
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """
+        :param key: zone_key
+        :return: cached zone name (or None) or MISSING
+        """
+        with self._lock:
+            value = self._entries.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, zone):
+        """
+        :param key: zone_key
+        :param zone: zone name or None if the point is outside all the zones of the city
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = zone
+            self._entries.move_to_end(key)
+            self._dirty = True
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        :return: text with size, hit rate and evictions
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            hit_rate = self.hits / requests if requests else 0.
+            return (f'zone cache: {len(self._entries)} entries, {self.hits} hits of {requests} '
+                    f'({hit_rate:.1%} polygon tests saved), {self.evictions} evicted')
+
+    def save(self):
+        """
+        Writes the cache to disk if it was changed (through a temp file, so the file is never half-written).
+        Retired cache isn't written, so it never overwrites the cache of the current geozones
+        :return: None
+        """
+        with self._lock:
+            if not self._dirty or self.retired:
+                return
+            state = {'geo_hash': self.geo_hash, 'entries': list(self._entries.items())}
+            self._dirty = False
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, geo_hash, max_entries=MAX_ENTRIES, path=ZONE_CACHE_PATH):
+        """
+        Reads the cache from disk. Missing, broken or outdated (other geo_hash) file gives an empty cache
+        :param geo_hash: payload_hash of the current geozones
+        :param max_entries: size bound
+        :param path: cache file path
+        :return: ZoneCache
+        """
+        logger = logging.getLogger(__name__)
+        cache = cls(geo_hash=geo_hash, max_entries=max_entries, path=path)
+        try:
+            with open(path, 'rb') as file:
+                state = pickle.load(file)
+        except FileNotFoundError:
+            return cache
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f'Zone cache file {path} is broken ({e!r}), starting with an empty cache')
+            return cache
+        if state.get('geo_hash') == geo_hash:
+            cache._entries.update(state['entries'][-max_entries:])  # the most recently used are at the end
+        else:
+            cache._dirty = True  # outdated file will be overwritten
+        return cache
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache(geo_hash):
+    """
+    Process-wide cache of the current geozones, loaded from disk on first use.
+    If geozones have changed, the previous cache is retired and a new empty one is started
+    :param geo_hash: payload_hash of the current geozones
+    :return: ZoneCache
+    """
+    global _shared
+    logger = logging.getLogger(__name__)
+    with _shared_lock:
+        if _shared is None:
+            _shared = ZoneCache.load(geo_hash)
+        elif _shared.geo_hash != geo_hash:
+            logger.info('Geozones have changed, new zone cache is started')
+            with _shared._lock:
+                _shared.retired = True
+            _shared = ZoneCache(geo_hash)
+            _shared._dirty = True  # the file of the old geozones will be overwritten
+        return _shared